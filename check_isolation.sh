@@ -29,6 +29,7 @@ usage () {
     echo "  -a <file>     Use a custom tempest.conf file for user_1"
     echo "  -b <file>     Use a custom tempest.conf file for user_2"
     echo "                Must be in $(pwd)/config/"
+    echo "  -f            Do not use the cached Keystone tokens"
     echo "  -h            Print this help message"
     echo ""
     echo "Exemple : $0 -a tempest-1.conf -b tempest-2.conf"
@@ -40,13 +41,16 @@ usage () {
 runMain () {
     STATUS=3
     cd "$(dirname "$0")"
+
+    # Private channel between setup and run (see fgcloud/rendezvous.py)
+    FGCLOUD_ISOLATION_CHANNEL=$(mktemp -d /tmp/tempest_isolation.XXXXXX)
+    export FGCLOUD_ISOLATION_CHANNEL
+
     {
     ./check_openstack.sh -c $CONF_FILE_A -- tempest.api.fgcloud.test_user_isolation_setup 2>&1 > /dev/null
+    rm -rf "$FGCLOUD_ISOLATION_CHANNEL"
     } &
 
-    # Wait some time for the VM to get ready
-    sleep 1
-
     {
     ./check_openstack.sh -c $CONF_FILE_B -- tempest.api.fgcloud.test_user_isolation_run
     } &
@@ -62,7 +66,7 @@ if [ $# -eq 0 ] ; then
 fi
 
 # Validate options
-if ! OPTIONS=$(getopt -o a:b:h "$@") ; then
+if ! OPTIONS=$(getopt -o a:b:fh "$@") ; then
     usage
 fi
 
@@ -78,6 +82,12 @@ while [ $# -gt 0 ]; do
             shift 2
             ;;
 
+        -f)
+            # Inherited by both check_openstack.sh
+            export FGCLOUD_FRESH_AUTH=1
+            shift
+            ;;
+
         -h)
             usage
             ;;
@@ -22,6 +22,9 @@
 # Default values
 MAXTIME=180
 CONF_FILE="tempest.conf"
+THRESHOLDS_FILE="thresholds.txt"
+STATE_DIR="/var/tmp/fgcloud"
+HISTORY_DB="$STATE_DIR/history.db"
 
 # Other variables
 DIRNAME="$( cd "$(dirname "$0")" ; pwd -P )"
@@ -34,7 +37,6 @@ STATUS_CRITICAL=2
 STATUS_UNKNOWN=3
 STATUS_DEPENDENT=4
 STATUS_ALL=('OK' 'WARNING' 'CRITICAL' 'UNKNOWN' 'DEPENDENT')
-SUBUNIT_TRACE="$TEMPEST/.venv/bin/subunit-trace"
 
 # Functions
 
@@ -43,92 +45,51 @@ usage () {
     echo "Run Tempest test suite and filter output for monitoring by Nagios/Icinga"
     echo "Output list of tests, failure traces, and performance data"
     echo ""
+    echo "  -b, --baseline <nb_runs>        Raise a WARNING on durations significantly above those of"
+    echo "                                  the last nb_runs runs stored in the history"
     echo "  -c, --config <file>             Use a custom tempest.conf file (default : tempest.conf)"
     echo "                                  Must be in $(pwd)/config/"
+    echo "  -d, --daemon <interval_in_sec>  Run the test(s) every interval from a persistent process"
+    echo "                                  that keeps the modules and tokens warm, and store the result"
     echo "  -e, --regex '^tempest\.regex'   Launch tests according to the regex (better in quotes)"
+    echo "  -f, --fresh-auth                Do not use the cached Keystone tokens, to test Keystone itself"
     echo "  -h, --help                      Print this usage message"
+    echo "  -l, --latest <max_age_in_sec>   Print the latest result stored by the daemon for the test(s)"
+    echo "                                  UNKNOWN if it is older than max_age"
+    echo "  -p, --parallel                  Run the regex tests in parallel, using one worker for"
+    echo "                                  each pair of static accounts found in accounts.yaml (not with -s)"
+    echo "  -r, --reap <max_age_in_sec>     First delete the test resources older than max_age"
+    echo "                                  left behind in the accounts of accounts.yaml"
+    echo "  -s, --sites <file,file,...>     Run the test(s) against several tempest.conf files at once"
+    echo "                                  and aggregate the results (worst status). Must be in $(pwd)/config/"
     echo "  -t, --timeout <time_in_sec>     Raise a WARNING if the test(s) run longer (default : 180s)"
+    echo "  -T, --thresholds <file>         Warning and critical limits per phase and per test, an exec_time"
+    echo "                                  limit replaces --timeout (default : thresholds.txt if it exists)"
+    echo "                                  Must be in $(pwd)/config/"
     echo "  -u, --update                    Update the virtual environment"
+    echo "  --passive <cmd_file,host,svc>   With --daemon, also send each result as a Nagios passive check"
     echo "  -- <single.test.to.run>         After any other options add a double dash following a test.name.to.run"
     echo ""
     echo "Exemple : $0 -t 90 -- tempest.scenario.test_basic_scenario"
     echo "Exemple : $0 -e '(^tempest\.scenario\.test_basic_(scenario|values))'"
+    echo "Exemple : $0 -d 300 -- tempest.api.fgcloud.test_basic_scenario"
+    echo "Exemple : $0 -l 900 -- tempest.api.fgcloud.test_basic_scenario"
+    echo "Exemple : $0 -s site1.conf,site2.conf -- tempest.api.fgcloud.test_basic_scenario"
     runExit $STATUS_CRITICAL "No test was run !" "exec_time=0s;;;; nb_test=0;;;; nb_tests_ok=0;;;; nb_tests_ko=0;;;; nb_skipped=0;;;;"
 }
 
 getPerfData () {
-    STREAM="$1"
-    STATUS=$2
-    OUT=""
-
-    ## Filter output to get values
-
-    # Check if there was at least a test
-    NO_TEST="The test run didn't actually run any tests"
-    if [[ $STREAM =~ $NO_TEST ]]; then 
-        runExit $STATUS_UNKNOWN "$STREAM" "exec_time=0s;;;; nb_tests=0;;;; nb_tests_ok=0;;;; nb_tests_ko=0;;;; nb_skipped=0;;;;"        
-    fi
-
-    # Get test status
-    TIME=$(echo "$STREAM" | awk '/^Ran:.*tests\ in/ {printf "%d", $5}')
-    PASSED=$(echo "$STREAM" | awk '/^\ -\ Passed:/ {print $3}')
-    SKIPPED=$(echo "$STREAM" | awk '/^\ -\ Skipped:/ {print $3}')
-    EXFAIL=$(echo "$STREAM" | awk '/^\ -\ Expected\ Fail:/ {print $4}')
-    UNEXOK=$(echo "$STREAM" | awk '/^\ -\ Unexpected\ Success:/ {print $4}')
-    FAILED=$(echo "$STREAM" | awk '/^\ -\ Failed:/ {print $3}')
-
-    # Construct PerfData for Nagios
-    let NBTESTS=SKIPPED+PASSED+EXFAIL+UNEXOK+FAILED
-    let NB_OK=PASSED+EXFAIL
-    let NB_KO=UNEXOK+FAILED
-    PERFDATA="exec_time="$TIME"s;;;; nb_tests=$NBTESTS;;;; nb_tests_ok=$NB_OK;;;; nb_tests_ko=$NB_KO;;;; nb_skipped=$SKIPPED;;;;"
-    INFODATA="exec_time="$TIME"s nb_tests=$NBTESTS nb_tests_ok=$NB_OK nb_tests_ko=$NB_KO nb_skipped=$SKIPPED"
-
-    # Get LOG output from tests (see tempest.conf/[DEFAULT]/default_log_levels)
-    PATTERN="^2[0-9][0-9][0-9]-"
-    LOGOUTPUT=$(echo "$STREAM" | awk '/^2[0-9][0-9][0-9]-/ {print}')
-    if [[ $LOGOUTPUT =~ $PATTERN ]]; then
-        OUT+="-------------- Captured logging --------------\n"
-        OUT+=$LOGOUTPUT
-    fi
-
-    # Compute output status
-    if [ $PASSED -gt 0 ] || [ $EXFAIL -gt 0 ]; then
-        STATUS=$STATUS_OK
-    fi
-
-    # Throw a Warning
-    if [ $(bc <<< "($MAXTIME - $TIME) < 0") -eq 1 ] || [ $SKIPPED -gt 0 ] || [ $UNEXOK -gt 0 ]; then
-        STATUS=$STATUS_WARNING
-    fi
-
-    # Add list of skipped tests
-    if [ $SKIPPED -gt 0 ]; then
-        OUT+="\n-------------- Skipped Tests --------------\n"
-        OUT+=$(echo "$STREAM" | grep "SKIPPED")
-    fi
-
-    # Add details about the failed tests
-    if [ $FAILED -gt 0 ]; then 
-        STATUS=$STATUS_CRITICAL
-
-        OUT+="\n-------------- Details / Trace --------------\n"
-        # exclude blank lines, OK and SKIPPED tests, LOGOUTPUT
-        OUT+=$(echo "$STREAM" | awk '/(^\s*$)|(.*\ ok$)|(.*\ SKIPPED)|(2[0-9][0-9][0-9]-)|(^~)|(^Sum\ of\ execute\ time)/ {next}; 
-              /^Captured\ pythonlogging/ {cap=1; next} /^Captured\ traceback/ {cap=0;next}; 
-              /^======$/ {skip=20;next} skip>0 {--skip;next};
-              /^.*FAILED$/ {print ""}1;')"\n\n"
-    fi
-
-    # Add a summary
-    OUT+="\n-------------- Summary --------------\n"
-    OUT+=$(echo "$STREAM" | awk 'prt-->0; /^Ran:.*tests\ in/ {prt=5;print}')
-
-    # Add a header
-    OUT="${STATUS_ALL[$STATUS]} : $INFODATA\n"$OUT
+    # Read the subunit v2 stream from stdin, in a single pass (see fgcloud/nagios.py)
+    # Output the list of tests, failure traces, and performance data
+    # Merge the values sent by the tests themselves (see fgcloud/perfdata.py)
+    # Store the run in the history (see fgcloud/history.py)
+    # Apply the limits of the thresholds file (see fgcloud/thresholds.py)
+    $RUN_CMD python -m tempest.api.fgcloud.nagios --maxtime $MAXTIME --perfdata-file "$FGCLOUD_PERFDATA_FILE" \
+        --history "$HISTORY_DB" --check-key "$(getCheckKey)" --baseline ${BASELINE:-0} $THRESHOLDS_ARGS
+    STATUS=$?
 
     # Go to output/exit
-    runExit $STATUS "$OUT" "$PERFDATA"
+    cleanExit $STATUS
 }
 
 runExit () {
@@ -137,26 +98,36 @@ runExit () {
     PERFDATA="$3"
 
     echo -e "$OUTPUT\nStatus : exit $STATUS (${STATUS_ALL[$STATUS]}) | $PERFDATA" 
+    cleanExit $STATUS
+}
+
+cleanExit () {
+    if [ -n "$FGCLOUD_PERFDATA_FILE" ]; then
+        rm -f "$FGCLOUD_PERFDATA_FILE"
+    fi
     cd $OLDPWD
-    exit $STATUS
+    exit $1
+}
+
+reapLeaked () {
+    # Delete the resources of killed or timed out runs (see fgcloud/reaper.py)
+    # The counts are merged into the perfdata by getPerfData
+    $RUN_CMD python -m tempest.api.fgcloud.reaper --max-age $REAP_AGE > /dev/null 2>&1
 }
 
 runOneTest () {
     TEST_ID=$1
 
     # Running a single test using subunit.run
-    # Redirecting output and error to subunit-trace then $STREAM
-    STREAM=`$RUN_CMD python -m subunit.run $TEST_ID 2>&1 | $SUBUNIT_TRACE`
-    STATUS=$?
-
-    getPerfData "$STREAM" $STATUS
+    # Redirecting output and error to getPerfData
+    getPerfData < <($RUN_CMD python -m subunit.run $TEST_ID 2>&1)
 }
 
 runRegexTests () {
     REGEX=$1
 
     # Running many tests using ostestr with a regex
-    # Redirecting output and error to subunit-trace then $STREAM
+    # Redirecting output and error to getPerfData
 
     # As of https://bugs.launchpad.net/os-testr/+bug/1506215, we cannot use blacklist for now
     # XXX Skipping tests manually :
@@ -164,13 +135,101 @@ runRegexTests () {
     # tempest.api.fgcloud.test_user_isolation_* # use ./check_isolation.sh instead
     REGFULL='((?!^tempest.api.compute.test_authorization)(?!^tempest.api.fgcloud.test_user_isolation_)('$REGEX'))'
 
-    STREAM=`$RUN_CMD ostestr --serial --no-slowest --no-pretty --subunit --regex $REGFULL 2>&1 | $SUBUNIT_TRACE`
-    STATUS=$?
+    if [ $PARALLEL ]; then
+        RUN_MODE="--concurrency $(getWorkers)"
+    else
+        RUN_MODE="--serial"
+    fi
 
-    # Have to filter the output because of ostestr auto discovery when using regex
-    STREAM=$(sed '/^running/,+4d' <<< "$STREAM")
+    # The "running=..." lines of ostestr auto discovery are not part of the
+    # subunit stream and are ignored by the parser
+    getPerfData < <($RUN_CMD ostestr $RUN_MODE --no-slowest --no-pretty --subunit --regex $REGFULL 2>&1)
+}
+
+getCheckKey () {
+    # Name of the check in the history : tempest.conf and test(s)
+    echo "$(basename "$CONF_NAME" .conf) $TEST$REGEX"
+}
 
-    getPerfData "$STREAM" $STATUS
+getResultFile () {
+    # One result file per tempest.conf and test(s) run by the daemon
+    KEY=$(echo -n "$CONF_NAME $TEST $REGEX" | md5sum | cut -c1-8)
+    echo "$STATE_DIR/$(basename "$CONF_NAME" .conf)_$KEY.result"
+}
+
+runDaemon () {
+    # Keep a python process running the test(s) every $INTERVAL seconds
+    # See fgcloud/daemon.py
+    DAEMON_ARGS="--interval $INTERVAL --maxtime $MAXTIME --result-file $RESULT_FILE"
+    DAEMON_ARGS+=" --history $HISTORY_DB --baseline ${BASELINE:-0} $THRESHOLDS_ARGS"
+    if [ -n "$PASSIVE" ]; then
+        DAEMON_ARGS+=" --passive $PASSIVE"
+    fi
+    if [ -n "$REAP_AGE" ]; then
+        DAEMON_ARGS+=" --reap $REAP_AGE"
+    fi
+
+    if [ -n "$TEST" ]; then
+        exec $RUN_CMD python -m tempest.api.fgcloud.daemon $DAEMON_ARGS --check-key "$(getCheckKey)" $TEST
+    else
+        exec $RUN_CMD python -m tempest.api.fgcloud.daemon $DAEMON_ARGS --check-key "$(getCheckKey)" --regex $REGEX
+    fi
+}
+
+runSites () {
+    # Run the test(s) against each site in its own process, at the same time
+    # See fgcloud/multisite.py
+    # Each site runs its tests one at a time (see fgcloud/daemon.py)
+    if [ $PARALLEL ]; then
+        runExit $STATUS_UNKNOWN "-p cannot be used with -s, the tests of each site are run one at a time" "exec_time=0s;;;; nb_tests=0;;;; nb_tests_ok=0;;;; nb_tests_ko=0;;;; nb_skipped=0;;;;"
+    fi
+    SITES_ARGS="--sites $SITES --config-dir $DIRNAME/config --maxtime $MAXTIME"
+    SITES_ARGS+=" --history $HISTORY_DB --baseline ${BASELINE:-0} $THRESHOLDS_ARGS"
+    if [ -n "$REAP_AGE" ]; then
+        SITES_ARGS+=" --reap $REAP_AGE"
+    fi
+
+    if [ -n "$TEST" ]; then
+        $RUN_CMD python -m tempest.api.fgcloud.multisite $SITES_ARGS $TEST
+    else
+        $RUN_CMD python -m tempest.api.fgcloud.multisite $SITES_ARGS --regex $REGEX
+    fi
+    cleanExit $?
+}
+
+getLatest () {
+    # Print the result stored by the daemon, no need to load the venv
+    if [ ! -f "$RESULT_FILE" ]; then
+        runExit $STATUS_UNKNOWN "No result stored by the daemon ($RESULT_FILE)" "exec_time=0s;;;; nb_tests=0;;;; nb_tests_ok=0;;;; nb_tests_ko=0;;;; nb_skipped=0;;;;"
+    fi
+
+    let AGE=$(date +%s)-$(stat -c %Y "$RESULT_FILE")
+    if [ $AGE -gt $MAXAGE ]; then
+        runExit $STATUS_UNKNOWN "The latest result stored by the daemon is $AGE sec old ($RESULT_FILE)" "exec_time=0s;;;; nb_tests=0;;;; nb_tests_ok=0;;;; nb_tests_ko=0;;;; nb_skipped=0;;;;"
+    fi
+
+    STATUS=$(head -n 1 "$RESULT_FILE")
+    tail -n +2 "$RESULT_FILE"
+    exit $STATUS
+}
+
+getWorkers () {
+    # Tempest needs 2 static accounts per concurrent test, so the number of
+    # workers is half the number of users defined in accounts.yaml
+    ACCOUNTS_FILE=$(awk -F '=' '/^\[/ {auth=($0 ~ /^\[auth\]/); next}
+                    auth && $1 ~ /^[ \t]*test_accounts_file[ \t]*$/ {gsub(/[ \t]/, "", $2); print $2}' "$CONF_FILE")
+
+    # The path is relative to the tempest directory
+    NB_ACCOUNTS=0
+    if [ -n "$ACCOUNTS_FILE" ] && [ -f "$ACCOUNTS_FILE" ]; then
+        NB_ACCOUNTS=$(grep -c '^[[:space:]]*-[[:space:]]*username:' "$ACCOUNTS_FILE")
+    fi
+
+    let WORKERS=NB_ACCOUNTS/2
+    if [ $WORKERS -lt 1 ]; then
+        WORKERS=1
+    fi
+    echo $WORKERS
 }
 
 initEnv () {
@@ -179,6 +238,15 @@ initEnv () {
         CONF_FILE=`readlink -f "$DIRNAME/config/$CONF_FILE"`
         export TEMPEST_CONFIG_DIR=`dirname "$CONF_FILE"`
         export TEMPEST_CONFIG=`basename "$CONF_FILE"`
+    else
+        CONF_FILE="$TEMPEST/etc/$CONF_FILE"
+    fi
+
+    # Optional thresholds file, an explicit one must exist
+    if [ -f "$DIRNAME/config/$THRESHOLDS_FILE" ]; then
+        THRESHOLDS_ARGS="--thresholds $(readlink -f "$DIRNAME/config/$THRESHOLDS_FILE")"
+    elif [ -n "$THRESHOLDS_SET" ]; then
+        runExit $STATUS_UNKNOWN "Thresholds file $DIRNAME/config/$THRESHOLDS_FILE not found" "exec_time=0s;;;; nb_tests=0;;;; nb_tests_ok=0;;;; nb_tests_ko=0;;;; nb_skipped=0;;;;"
     fi
 
     # Check from where we are running the script
@@ -198,11 +266,33 @@ initEnv () {
     fi
 
     ${RUN_CMD} find $TEMPEST -type f -name "*.pyc" -delete
+
+    # Perfdata values sent by the tests, merged by getPerfData
+    export FGCLOUD_PERFDATA_FILE=$(mktemp /tmp/fgcloud_perfdata.XXXXXX)
 }
 
 runMain () {
+    CONF_NAME=$CONF_FILE
+    RESULT_FILE=$(getResultFile)
+
+    if [ -n "$MAXAGE" ] && [ -n "$TEST$REGEX" ]; then
+        getLatest
+    fi
+
     initEnv
 
+    if [ -n "$INTERVAL" ] && [ -n "$TEST$REGEX" ]; then
+        runDaemon
+    fi
+
+    if [ -n "$SITES" ] && [ -n "$TEST$REGEX" ]; then
+        runSites
+    fi
+
+    if [ -n "$REAP_AGE" ]; then
+        reapLeaked
+    fi
+
     if [ -n "$TEST" ]; then
         runOneTest $TEST
     elif [ -n "$REGEX" ]; then
@@ -212,7 +302,7 @@ runMain () {
     fi
 }
 
-if ! OPTIONS=$(getopt -o c:e:ht:u -l config:,regex:,help,timeout:,update -- "$@") ; then
+if ! OPTIONS=$(getopt -o b:c:d:e:fhl:pr:s:t:T:u -l baseline:,config:,daemon:,regex:,fresh-auth,help,latest:,parallel,passive:,reap:,sites:,timeout:,thresholds:,update -- "$@") ; then
     usage
 fi
 if [ $# -eq 0 ] ; then
@@ -224,25 +314,72 @@ FIRST_UU=yes
 
 while [ $# -gt 0 ]; do
     case "$1" in
+        -b|--baseline)
+            BASELINE=$2
+            shift 2
+            ;;
+
         -c|--config)
             CONF_FILE=$2
             shift 2
             ;;
 
+        -d|--daemon)
+            INTERVAL=$2
+            shift 2
+            ;;
+
         -e|--regex)
             REGEX=$2
             shift 2
             ;;
 
+        -f|--fresh-auth)
+            # See fgcloud/token_cache.py
+            export FGCLOUD_FRESH_AUTH=1
+            shift
+            ;;
+
         -h|--help)
             usage
             ;;
 
+        -l|--latest)
+            MAXAGE=$2
+            shift 2
+            ;;
+
+        -p|--parallel)
+            PARALLEL=1
+            shift
+            ;;
+
+        --passive)
+            PASSIVE=$2
+            shift 2
+            ;;
+
+        -r|--reap)
+            REAP_AGE=$2
+            shift 2
+            ;;
+
+        -s|--sites)
+            SITES=$2
+            shift 2
+            ;;
+
         -t|--timeout)
             MAXTIME=$2
             shift 2
             ;;
 
+        -T|--thresholds)
+            THRESHOLDS_FILE=$2
+            THRESHOLDS_SET=1
+            shift 2
+            ;;
+
         -u|--update)
             UPDATEVENV=1
             shift 
@@ -0,0 +1,111 @@
+# Copyright 2015 France-Grilles - IDGC - CNRS
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+"""Latency of each REST call made by the tempest clients
+
+Every HTTP request of the service clients (servers_client, volumes_client,
+keypairs_client, ...) is timed and grouped by service (ie. api_compute).
+The endpoints of [fgcloud]/api_latency_endpoints get their own group, named
+by service, method and endpoint, the ids being replaced by 'id' :
+GET /v2.1/<tenant>/servers/<uuid> is api_compute_get_servers_id.
+
+The raw times are sent as perfdata samples, so that nagios.py computes the
+p50, p95, max and count of each group over all the parallel workers (ie.
+api_volume_p95).
+"""
+import collections
+import re
+import threading
+import time
+
+from oslo_log import log as logging
+from six.moves.urllib import parse as urlparse
+
+from tempest.api.fgcloud import options  # noqa
+from tempest.api.fgcloud import perfdata
+from tempest import config
+
+CONF = config.CONF
+LOG = logging.getLogger(__name__)
+
+VERSION_PATTERN = re.compile(r'^v[0-9]+(\.[0-9]+)?$')
+ID_PATTERN = re.compile(r'^([0-9a-fA-F-]{32,36}|[0-9]+)$')
+
+_lock = threading.Lock()
+_latencies = collections.OrderedDict()
+_installed = []
+
+
+def endpoint(url):
+    """Return the path of the url without the version and the ids"""
+    segments = []
+    for segment in urlparse.urlparse(url).path.split('/'):
+        if not segment or VERSION_PATTERN.match(segment):
+            continue
+        if ID_PATTERN.match(segment):
+            segment = 'id'
+        segments.append(segment)
+    # The tenant id of the compute and volume urls
+    while segments and segments[0] == 'id':
+        segments.pop(0)
+    name = '_'.join(segments) or 'root'
+    return re.sub(r'[^a-zA-Z0-9_]', '_', name)
+
+
+def record(service, method, url, seconds):
+    service = service or 'unknown'
+    keys = [service]
+    key = '%s_%s_%s' % (service, method.lower(), endpoint(url))
+    if key in CONF.fgcloud.api_latency_endpoints:
+        keys.append(key)
+    with _lock:
+        for key in keys:
+            _latencies.setdefault(key, []).append(seconds)
+
+
+def report():
+    """Send the times of each group as perfdata samples"""
+    with _lock:
+        latencies = list(_latencies.items())
+        _latencies.clear()
+    for key, values in latencies:
+        perfdata.add_samples('api_%s' % key, values, 's')
+
+
+perfdata.on_flush(report)
+
+
+def install():
+    """Time the requests of all the tempest REST clients"""
+    if _installed or not CONF.fgcloud.api_latency:
+        return
+    try:
+        from tempest.lib.common import rest_client
+        raw_request = rest_client.RestClient.raw_request
+    except (ImportError, AttributeError):
+        LOG.warning("This version of tempest cannot time the API calls")
+        return
+
+    def timed_raw_request(self, url, method, *args, **kwargs):
+        start = time.time()
+        try:
+            return raw_request(self, url, method, *args, **kwargs)
+        finally:
+            record(getattr(self, 'service', None), method, url,
+                   time.time() - start)
+
+    rest_client.RestClient.raw_request = timed_raw_request
+    _installed.append(raw_request)
+
+# EOF
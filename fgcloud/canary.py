@@ -0,0 +1,76 @@
+# Copyright 2015 France-Grilles - IDGC - CNRS
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+"""State file of the long-lived canary resources (see test_canary_pool.py)
+
+The file holds one entry per account (tenant/user), with the ids of the
+canary server, volume, floating IP, security group and the keypair (private
+key included, so the file is only readable by its owner).
+"""
+import contextlib
+import fcntl
+import json
+import os
+import tempfile
+
+
+class CanaryState(object):
+
+    def __init__(self, path):
+        self.path = path
+        self.lock_path = path + '.lock'
+
+    @contextlib.contextmanager
+    def locked(self):
+        """Hold an exclusive lock while the canaries are used"""
+        directory = os.path.dirname(os.path.abspath(self.path))
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        with open(self.lock_path, 'a') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                yield self
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def load(self):
+        if not os.path.exists(self.path):
+            return {}
+        with open(self.path) as f:
+            try:
+                return json.load(f)
+            except ValueError:
+                # Broken file, the canaries will be created again
+                return {}
+
+    def get(self, account):
+        return self.load().get(account)
+
+    def set(self, account, entry):
+        data = self.load()
+        if entry is None:
+            data.pop(account, None)
+        else:
+            data[account] = entry
+        self._save(data)
+
+    def _save(self, data):
+        directory = os.path.dirname(os.path.abspath(self.path))
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.canary.')
+        os.fchmod(fd, 0o600)
+        with os.fdopen(fd, 'w') as f:
+            json.dump(data, f, indent=2, sort_keys=True)
+        os.rename(tmp_path, self.path)
+
+# EOF
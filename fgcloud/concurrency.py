@@ -0,0 +1,151 @@
+# Copyright 2015 France-Grilles - IDGC - CNRS
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+import collections
+import sys
+import threading
+import time
+
+from oslo_log import log as logging
+import six
+
+LOG = logging.getLogger(__name__)
+
+DEFAULT_WORKERS = 8
+
+
+class TaskGraph(object):
+    """Run functions in threads, each one as soon as its requirements are done
+
+    graph = TaskGraph()
+    graph.add('keypair', self.create_keypair)
+    graph.add('server', lambda: boot(graph.results['keypair']),
+              requires=['keypair'])
+    graph.add('volume', self.create_volume)
+    graph.run()
+
+    A task whose requirement failed is not run (see cancelled), unless
+    cancel_on_error is False: then a task only waits for its requirements to
+    be over (ie. to delete resources). By default run() raises the first
+    error once every other task is over.
+    """
+
+    def __init__(self, max_workers=DEFAULT_WORKERS, cancel_on_error=True):
+        self.max_workers = max(1, max_workers)
+        self.cancel_on_error = cancel_on_error
+        self._tasks = collections.OrderedDict()
+        self.results = {}
+        self.errors = collections.OrderedDict()
+        self.durations = {}
+        self.cancelled = []
+
+    def add(self, name, func, requires=()):
+        for required in requires:
+            if required not in self._tasks:
+                raise ValueError("Task %s requires the unknown task %s" %
+                                 (name, required))
+        self._tasks[name] = (func, tuple(requires))
+
+    def _run_task(self, cond, running, name, func):
+        start = time.time()
+        try:
+            result = func()
+        except Exception:
+            exc_info = sys.exc_info()
+            LOG.debug("Task %s failed : %s" % (name, exc_info[1]))
+            with cond:
+                self.errors[name] = exc_info
+        else:
+            with cond:
+                self.results[name] = result
+        finally:
+            with cond:
+                self.durations[name] = time.time() - start
+                running.discard(name)
+                cond.notify()
+
+    def _cancel_failed_branches(self, pending):
+        changed = True
+        while changed:
+            changed = False
+            for name, (func, requires) in list(pending.items()):
+                if any(r in self.errors or r in self.cancelled
+                       for r in requires):
+                    del pending[name]
+                    self.cancelled.append(name)
+                    changed = True
+
+    def _is_done(self, name):
+        if name in self.results:
+            return True
+        return not self.cancel_on_error and name in self.errors
+
+    def run(self, raise_on_error=True):
+        pending = collections.OrderedDict(self._tasks)
+        running = set()
+        cond = threading.Condition()
+
+        with cond:
+            while pending or running:
+                if self.cancel_on_error:
+                    self._cancel_failed_branches(pending)
+                for name, (func, requires) in list(pending.items()):
+                    if len(running) >= self.max_workers:
+                        break
+                    if all(self._is_done(r) for r in requires):
+                        del pending[name]
+                        running.add(name)
+                        thread = threading.Thread(
+                            target=self._run_task,
+                            args=(cond, running, name, func))
+                        thread.daemon = True
+                        thread.start()
+                if running:
+                    cond.wait()
+
+        if raise_on_error and self.errors:
+            six.reraise(*list(self.errors.values())[0])
+        return self.results
+
+
+class BackgroundTask(object):
+    """Run a function in a thread, join() returns its result or raises
+
+    boot = BackgroundTask(self.boot_server)
+    ...
+    server = boot.join()
+    """
+
+    def __init__(self, func):
+        self._func = func
+        self._result = None
+        self._exc_info = None
+        self._thread = threading.Thread(target=self._run)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def _run(self):
+        try:
+            self._result = self._func()
+        except Exception:
+            self._exc_info = sys.exc_info()
+            LOG.debug("Background task failed : %s" % self._exc_info[1])
+
+    def join(self, timeout=None):
+        self._thread.join(timeout)
+        if self._exc_info is not None:
+            six.reraise(*self._exc_info)
+        return self._result
+
+# EOF
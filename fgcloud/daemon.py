@@ -0,0 +1,242 @@
+# Copyright 2015 France-Grilles - IDGC - CNRS
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+"""Run the fgcloud tests on a schedule from a persistent process
+
+The interpreter, the tempest modules, tempest.conf and the authenticated
+clients (Keystone tokens) stay warm between two runs. The result of the last
+run is written to a file that check_openstack.sh -l reads without starting
+python, and optionally sent to Nagios as a passive check result.
+
+Usage (from the tempest directory, see check_openstack.sh -d) :
+  python -m tempest.api.fgcloud.daemon --interval 300 \\
+      --result-file /var/tmp/fgcloud/basic.result \\
+      tempest.api.fgcloud.test_basic_scenario
+"""
+import argparse
+import os
+import re
+import signal
+import sys
+import tempfile
+import time
+import unittest
+
+from oslo_log import log as logging
+import testtools
+
+from tempest.api.fgcloud import nagios
+from tempest.api.fgcloud import perfdata
+from tempest.api.fgcloud import reaper
+from tempest.api.fgcloud import thresholds as fg_thresholds
+
+LOG = logging.getLogger(__name__)
+
+FGCLOUD_DIR = os.path.dirname(os.path.abspath(__file__))
+TEMPEST_DIR = os.path.dirname(os.path.dirname(FGCLOUD_DIR))
+
+# Skipped like in check_openstack.sh -e :
+# test_authorization fails because of the custom FGCloud policy,
+# test_user_isolation_* are run by check_isolation.sh, together they would
+# wait for each other until [fgcloud]/isolation_timeout
+EXCLUDED = re.compile(r'^tempest\.api\.compute\.test_authorization|'
+                      r'^tempest\.api\.fgcloud\.test_user_isolation_')
+
+_auth_providers = {}
+
+
+def _credentials_key(credentials):
+    return tuple(getattr(credentials, attr, None) for attr in (
+        'username', 'user_domain_name', 'tenant_name', 'project_name',
+        'project_domain_name', 'password'))
+
+
+def keep_auth_providers_warm():
+    """Reuse one auth provider (and its token) per set of credentials
+
+    tempest builds a new auth provider, hence a new Keystone token, for each
+    client manager, that is for each test class of each run.
+    """
+    try:
+        from tempest import manager
+        get_auth_provider = manager.get_auth_provider
+    except (ImportError, AttributeError):
+        LOG.warning("This version of tempest cannot share auth providers, "
+                    "tokens will not be kept between runs")
+        return
+
+    def cached_get_auth_provider(credentials, *args, **kwargs):
+        key = _credentials_key(credentials) + tuple(sorted(kwargs.items()))
+        if key not in _auth_providers:
+            _auth_providers[key] = get_auth_provider(credentials,
+                                                     *args, **kwargs)
+        return _auth_providers[key]
+
+    manager.get_auth_provider = cached_get_auth_provider
+
+
+def load_tests(test_ids, regex=None):
+    """Load the test(s) by name, or the tempest tests matching the regex
+
+    Like ostestr --regex in check_openstack.sh -e, the whole of tempest is
+    discovered and the EXCLUDED tests are left out.
+    """
+    loader = unittest.TestLoader()
+    if test_ids:
+        suite = loader.loadTestsFromNames(test_ids)
+    else:
+        suite = loader.discover(TEMPEST_DIR, pattern='test_*.py',
+                                top_level_dir=os.path.dirname(TEMPEST_DIR))
+    if regex:
+        pattern = re.compile(regex)
+        suite = unittest.TestSuite(
+            test for test in testtools.iterate_tests(suite)
+            if pattern.search(test.id()) and not EXCLUDED.search(test.id()))
+        if not suite.countTestCases():
+            raise ValueError("No test matches the regex %s" % regex)
+    return suite
+
+
+def run_once(test_ids, regex, maxtime, reap_age=None, history=None,
+             check_key=None, baseline=0, thresholds_file=None):
+    """Run the tests in this process and return the Nagios result"""
+    suite = load_tests(test_ids, regex)
+    # Read at each run, a change does not need a restart
+    thresholds = None
+    if thresholds_file:
+        thresholds = fg_thresholds.Thresholds.load(thresholds_file)
+    result = nagios.NagiosResult()
+
+    fd, perfdata_file = tempfile.mkstemp(prefix='fgcloud_perfdata.')
+    os.close(fd)
+    os.environ[perfdata.PERFDATA_ENV] = perfdata_file
+    try:
+        if reap_age is not None:
+            try:
+                reaper.reap(reap_age)
+            except Exception:
+                LOG.exception("Cannot delete the leaked resources")
+        decorated = testtools.ExtendedToStreamDecorator(result)
+        decorated.startTestRun()
+        try:
+            suite.run(decorated)
+        finally:
+            decorated.stopTestRun()
+        perfdata.flush()
+        return nagios.evaluate(result, maxtime,
+                               nagios.read_perfdata(perfdata_file),
+                               history, check_key, baseline, thresholds)
+    finally:
+        del os.environ[perfdata.PERFDATA_ENV]
+        os.remove(perfdata_file)
+
+
+def write_result(path, status, output, perfdata_line):
+    """Atomically replace the result file : status on the first line"""
+    directory = os.path.dirname(os.path.abspath(path))
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.result.')
+    with os.fdopen(fd, 'w') as f:
+        f.write('%d\n%s\n' % (status, nagios.format_output(
+            status, output, perfdata_line)))
+    os.rename(tmp_path, path)
+
+
+def send_passive_result(cmd_file, host, service, status, output,
+                        perfdata_line):
+    """Write a PROCESS_SERVICE_CHECK_RESULT to the Nagios command file"""
+    plugin_output = '%s|%s' % (output.replace('|', '/'), perfdata_line)
+    plugin_output = plugin_output.replace('\n', '\\n')
+    command = '[%d] PROCESS_SERVICE_CHECK_RESULT;%s;%s;%d;%s\n' % (
+        time.time(), host, service, status, plugin_output)
+    with open(cmd_file, 'a') as f:
+        f.write(command)
+
+
+def _stop(signum, frame):
+    raise SystemExit(0)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Run the fgcloud tests on a schedule')
+    parser.add_argument('tests', nargs='*', help='Test id(s) to run')
+    parser.add_argument('--regex',
+                        help='Run the tempest tests matching the regex')
+    parser.add_argument('--interval', type=int, default=300,
+                        help='Seconds between the start of two runs')
+    parser.add_argument('--maxtime', type=int, default=180,
+                        help='Raise a WARNING if the test(s) run longer')
+    parser.add_argument('--result-file', required=True,
+                        help='Where to store the result of the last run')
+    parser.add_argument('--passive', metavar='CMD_FILE,HOST,SERVICE',
+                        help='Also send the result as a Nagios passive check')
+    parser.add_argument('--reap', type=int, metavar='MAX_AGE',
+                        help='Delete the leaked test resources older than '
+                             'MAX_AGE seconds before each run')
+    parser.add_argument('--history',
+                        help='Store each run in this SQLite database')
+    parser.add_argument('--check-key',
+                        help='Name of the check in the history')
+    parser.add_argument('--baseline', type=int, default=0,
+                        help='Raise a WARNING on durations significantly '
+                             'above those of the last BASELINE runs')
+    parser.add_argument('--thresholds',
+                        help='Warning and critical limits per phase and per '
+                             'test (see config/thresholds.txt.sample)')
+    parser.add_argument('--once', action='store_true',
+                        help='Run the tests only once then exit')
+    args = parser.parse_args(argv)
+    if not args.tests and not args.regex:
+        parser.error('a test id or a regex is required')
+    passive = None
+    if args.passive:
+        passive = args.passive.split(',')
+        if len(passive) != 3:
+            parser.error('--passive expects CMD_FILE,HOST,SERVICE')
+
+    signal.signal(signal.SIGTERM, _stop)
+    keep_auth_providers_warm()
+
+    while True:
+        start = time.time()
+        try:
+            status, output, perfdata_line = run_once(
+                args.tests, args.regex, args.maxtime, args.reap,
+                args.history, args.check_key, args.baseline,
+                args.thresholds)
+        except Exception as exc:
+            LOG.exception("The test run failed")
+            status, output, perfdata_line = (
+                nagios.STATUS_UNKNOWN, 'The test run failed : %s' % exc,
+                nagios.NO_PERFDATA)
+
+        write_result(args.result_file, status, output, perfdata_line)
+        if passive:
+            try:
+                send_passive_result(passive[0], passive[1], passive[2],
+                                    status, output, perfdata_line)
+            except (IOError, OSError) as exc:
+                LOG.warning("Cannot send the passive result : %s" % exc)
+
+        if args.once:
+            return status
+        time.sleep(max(0, args.interval - (time.time() - start)))
+
+
+if __name__ == '__main__':
+    sys.exit(main())
+
+# EOF
@@ -0,0 +1,246 @@
+# Copyright 2015 France-Grilles - IDGC - CNRS
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+"""History of the check results in a local SQLite database
+
+Each run stores its status, the duration and status of each test and the
+perfdata values, under a check key (tempest.conf name and test or regex).
+The durations of a run can be compared with the same check's previous runs
+to detect slowdowns.
+
+Usage (from the tempest directory) :
+  python -m tempest.api.fgcloud.history [--check KEY] runs [--limit 20]
+  python -m tempest.api.fgcloud.history [--check KEY] report [--days 7]
+"""
+import argparse
+import math
+import os
+import re
+import sqlite3
+import sys
+import time
+
+DEFAULT_DB = '/var/tmp/fgcloud/history.db'
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    check_key TEXT NOT NULL,
+    started REAL NOT NULL,
+    status INTEGER NOT NULL,
+    elapsed REAL NOT NULL);
+CREATE INDEX IF NOT EXISTS runs_check ON runs (check_key, started);
+CREATE TABLE IF NOT EXISTS tests (
+    run_id INTEGER NOT NULL REFERENCES runs (id),
+    name TEXT NOT NULL,
+    status TEXT NOT NULL,
+    duration REAL);
+CREATE TABLE IF NOT EXISTS metrics (
+    run_id INTEGER NOT NULL REFERENCES runs (id),
+    label TEXT NOT NULL,
+    value REAL NOT NULL,
+    unit TEXT NOT NULL);
+CREATE INDEX IF NOT EXISTS metrics_run ON metrics (run_id, label);
+"""
+
+PERFDATA_PATTERN = re.compile(r'^([^=\s]+)=(-?[0-9.]+)([a-zA-Z%]*)')
+
+# A value is a regression when it is above the baseline mean by more than
+# Z_SCORE standard deviations and by more than MIN_INCREASE (relative)
+Z_SCORE = 3.0
+MIN_INCREASE = 0.2
+MIN_RUNS = 5
+
+
+def parse_perfdata(values):
+    """Return [(label, value, unit)] from 'label=valueUOM;;;;' strings"""
+    metrics = []
+    for item in values:
+        match = PERFDATA_PATTERN.match(item)
+        if match:
+            metrics.append((match.group(1), float(match.group(2)),
+                            match.group(3)))
+    return metrics
+
+
+def mean_stdev(values):
+    mean = sum(values) / len(values)
+    if len(values) < 2:
+        return mean, 0.0
+    variance = sum((v - mean) ** 2 for v in values) / (len(values) - 1)
+    return mean, math.sqrt(variance)
+
+
+def percentile(values, percent):
+    values = sorted(values)
+    index = int(math.ceil(percent / 100.0 * len(values))) - 1
+    return values[max(0, min(index, len(values) - 1))]
+
+
+class History(object):
+
+    def __init__(self, path=DEFAULT_DB):
+        directory = os.path.dirname(os.path.abspath(path))
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        # Several checks may write at the same time
+        self.db = sqlite3.connect(path, timeout=30)
+        self.db.executescript(SCHEMA)
+
+    def close(self):
+        self.db.close()
+
+    def record(self, check_key, status, elapsed, tests, metrics,
+               started=None):
+        """Store a run, tests as [(name, status, duration)]"""
+        with self.db:
+            cursor = self.db.execute(
+                'INSERT INTO runs (check_key, started, status, elapsed) '
+                'VALUES (?, ?, ?, ?)',
+                (check_key, started or time.time(), status, elapsed))
+            run_id = cursor.lastrowid
+            self.db.executemany(
+                'INSERT INTO tests (run_id, name, status, duration) '
+                'VALUES (?, ?, ?, ?)',
+                [(run_id, name, test_status, duration)
+                 for name, test_status, duration in tests])
+            self.db.executemany(
+                'INSERT INTO metrics (run_id, label, value, unit) '
+                'VALUES (?, ?, ?, ?)',
+                [(run_id, label, value, unit)
+                 for label, value, unit in metrics])
+        return run_id
+
+    def baseline(self, check_key, label, window):
+        """Values of a metric in the last window OK or WARNING runs"""
+        rows = self.db.execute(
+            'SELECT m.value FROM metrics m JOIN runs r ON m.run_id = r.id '
+            'WHERE r.check_key = ? AND r.status <= 1 AND m.label = ? '
+            'ORDER BY r.started DESC LIMIT ?', (check_key, label, window))
+        return [row[0] for row in rows]
+
+    def regressions(self, check_key, metrics, window):
+        """Return the durations significantly above their baseline
+
+        Only the values in seconds are compared, with the same check's last
+        window runs that did not fail (at least MIN_RUNS of them). A lasting
+        slowdown thus becomes the new baseline.
+        """
+        found = []
+        for label, value, unit in metrics:
+            if unit != 's':
+                continue
+            values = self.baseline(check_key, label, window)
+            if len(values) < MIN_RUNS:
+                continue
+            mean, stdev = mean_stdev(values)
+            if (value > mean + Z_SCORE * stdev and
+                    value > mean * (1 + MIN_INCREASE)):
+                found.append('%s=%.2fs is slower than the baseline : mean '
+                             '%.2fs, stdev %.2fs over %d runs' %
+                             (label, value, mean, stdev, len(values)))
+        return found
+
+    def runs(self, check_key=None, limit=20):
+        query = 'SELECT id, check_key, started, status, elapsed FROM runs'
+        params = []
+        if check_key:
+            query += ' WHERE check_key = ?'
+            params.append(check_key)
+        query += ' ORDER BY started DESC LIMIT ?'
+        params.append(limit)
+        return self.db.execute(query, params).fetchall()
+
+    def metric_values(self, check_key=None, since=0):
+        """Return {(check_key, label, unit): [values]}"""
+        query = ('SELECT r.check_key, m.label, m.unit, m.value FROM metrics m '
+                 'JOIN runs r ON m.run_id = r.id WHERE r.started >= ?')
+        params = [since]
+        if check_key:
+            query += ' AND r.check_key = ?'
+            params.append(check_key)
+        values = {}
+        for key, label, unit, value in self.db.execute(query, params):
+            values.setdefault((key, label, unit), []).append(value)
+        return values
+
+    def prune(self, max_days):
+        """Forget the runs older than max_days"""
+        limit = time.time() - max_days * 86400
+        with self.db:
+            old_runs = 'SELECT id FROM runs WHERE started < ?'
+            self.db.execute('DELETE FROM tests WHERE run_id IN (%s)' %
+                            old_runs, (limit,))
+            self.db.execute('DELETE FROM metrics WHERE run_id IN (%s)' %
+                            old_runs, (limit,))
+            self.db.execute('DELETE FROM runs WHERE started < ?', (limit,))
+
+
+def print_runs(history, args):
+    status_names = ('OK', 'WARNING', 'CRITICAL', 'UNKNOWN', 'DEPENDENT')
+    for run_id, check_key, started, status, elapsed in history.runs(
+            args.check, args.limit):
+        print('%s  %-8s %7.1fs  %s' % (
+            time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(started)),
+            status_names[status], elapsed, check_key))
+
+
+def print_report(history, args):
+    since = time.time() - args.days * 86400
+    values = history.metric_values(args.check, since)
+    print('%-40s %-24s %5s %9s %9s %9s %9s' % (
+        'check', 'label', 'runs', 'min', 'mean', 'p95', 'max'))
+    for (check_key, label, unit), items in sorted(values.items()):
+        mean, _ = mean_stdev(items)
+        print('%-40s %-24s %5d %8.2f%s %8.2f%s %8.2f%s %8.2f%s' % (
+            check_key[:40], label[:24], len(items),
+            min(items), unit[:1], mean, unit[:1],
+            percentile(items, 95), unit[:1], max(items), unit[:1]))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Show the history of the check results')
+    parser.add_argument('--db', default=DEFAULT_DB,
+                        help='History database (default : %(default)s)')
+    parser.add_argument('--check', help='Only this check key')
+    subparsers = parser.add_subparsers(dest='command')
+    runs = subparsers.add_parser('runs', help='Last runs and their status')
+    runs.add_argument('--limit', type=int, default=20)
+    report = subparsers.add_parser(
+        'report', help='Statistics of the perfdata values')
+    report.add_argument('--days', type=float, default=7)
+    prune = subparsers.add_parser('prune', help='Forget the old runs')
+    prune.add_argument('--days', type=float, default=90)
+    args = parser.parse_args(argv)
+
+    history = History(args.db)
+    try:
+        if args.command == 'runs':
+            print_runs(history, args)
+        elif args.command == 'report':
+            print_report(history, args)
+        elif args.command == 'prune':
+            history.prune(args.days)
+        else:
+            parser.error('a command is required')
+    finally:
+        history.close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
+
+# EOF
@@ -0,0 +1,121 @@
+# Copyright 2015 France-Grilles - IDGC - CNRS
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+"""Keep-alive HTTP connections shared by all the tempest clients
+
+Each tempest REST client has its own http.ClosingHttp, which asks the server
+to close the connection after each request: every call, polls included,
+pays a new TCP and TLS handshake. Instead, all the clients of a process
+share one pool of keep-alive connections per host (per set of TLS options),
+up to [fgcloud]/max_workers connections per host for the parallel calls.
+
+The number of connections opened, of requests and of requests sent on an
+already open connection are sent as perfdata (http_connections,
+http_requests, http_reused).
+"""
+import threading
+
+from oslo_log import log as logging
+
+from tempest.api.fgcloud import options  # noqa
+from tempest.api.fgcloud import perfdata
+from tempest import config
+
+CONF = config.CONF
+LOG = logging.getLogger(__name__)
+
+_lock = threading.Lock()
+_managers = {}
+# Counted since the last report, the pools live longer than a daemon run
+_counts = {'connections': 0, 'requests': 0}
+_installed = []
+
+
+def _count(name):
+    with _lock:
+        _counts[name] += 1
+
+
+def report():
+    """Add the connections opened and the requests since the last report"""
+    with _lock:
+        connections = _counts['connections']
+        requests = _counts['requests']
+        _counts.update(connections=0, requests=0)
+    if requests:
+        perfdata.add('http_connections', connections)
+        perfdata.add('http_requests', requests)
+        perfdata.add('http_reused', max(0, requests - connections))
+
+
+perfdata.on_flush(report)
+
+
+def install():
+    """Make the tempest REST clients share keep-alive connections"""
+    if _installed or not CONF.fgcloud.http_keep_alive:
+        return
+    try:
+        from tempest.lib.common import http
+        import urllib3
+        closing_http = http.ClosingHttp
+    except (ImportError, AttributeError):
+        LOG.warning("This version of tempest cannot share the HTTP "
+                    "connections")
+        return
+
+    # Count the connections where they are opened: the pool manager drops
+    # the pools beyond its num_pools, with their counters
+    class CountingHTTPConnectionPool(urllib3.HTTPConnectionPool):
+
+        def _new_conn(self):
+            _count('connections')
+            return super(CountingHTTPConnectionPool, self)._new_conn()
+
+    class CountingHTTPSConnectionPool(urllib3.HTTPSConnectionPool):
+
+        def _new_conn(self):
+            _count('connections')
+            return super(CountingHTTPSConnectionPool, self)._new_conn()
+
+    class KeepAliveHttp(closing_http):
+
+        def __init__(self, *args, **kwargs):
+            super(KeepAliveHttp, self).__init__(*args, **kwargs)
+            self.connection_pool_kw['maxsize'] = CONF.fgcloud.max_workers
+            self.pool_classes_by_scheme = {
+                'http': CountingHTTPConnectionPool,
+                'https': CountingHTTPSConnectionPool}
+
+        def urlopen(self, method, url, *args, **kwargs):
+            # Drop the 'connection: close' added by ClosingHttp.request
+            headers = kwargs.get('headers')
+            if headers and 'connection' in headers:
+                kwargs['headers'] = dict(
+                    (k, v) for k, v in headers.items() if k != 'connection')
+            _count('requests')
+            return super(KeepAliveHttp, self).urlopen(method, url, *args,
+                                                      **kwargs)
+
+    def shared_http(*args, **kwargs):
+        key = (args, tuple(sorted(kwargs.items())))
+        with _lock:
+            if key not in _managers:
+                _managers[key] = KeepAliveHttp(*args, **kwargs)
+            return _managers[key]
+
+    http.ClosingHttp = shared_http
+    _installed.append(closing_http)
+
+# EOF
@@ -0,0 +1,49 @@
+# Copyright 2015 France-Grilles - IDGC - CNRS
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+"""Hooks of the fgcloud checks into the tempest clients
+
+API latency (api_latency.py), shared keep-alive connections (http_pool.py)
+and cached Keystone tokens (token_cache.py), each one enabled in [fgcloud].
+They patch tempest for the whole process, so they are installed by the
+fgcloud test classes when they are set up and by the runners (daemon.py,
+reaper.py), not when a module is imported.
+"""
+from tempest.api.fgcloud import api_latency
+from tempest.api.fgcloud import http_pool
+from tempest.api.fgcloud import token_cache
+
+
+def install_all():
+    """Install the enabled hooks, once per process"""
+    api_latency.install()
+    http_pool.install()
+    token_cache.install()
+
+
+class InstrumentedTest(object):
+    """Mixin of the fgcloud test classes, before the tempest base class
+
+    class TestBasicScenario(instrument.InstrumentedTest,
+                            manager.ScenarioTest):
+
+    The hooks are installed before the clients of the class are created.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        install_all()
+        super(InstrumentedTest, cls).setUpClass()
+
+# EOF
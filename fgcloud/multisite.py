@@ -0,0 +1,211 @@
+# Copyright 2015 France-Grilles - IDGC - CNRS
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+"""Run the same check against several sites at once and aggregate
+
+tempest.conf is global to a python process, so each site (one tempest.conf
+file) runs in its own daemon.py --once process, all of them at the same
+time. The result is the worst status, one section per site and the perfdata
+of every site prefixed with its name (ie. site1_boot_time).
+
+Usage (from the tempest directory, see check_openstack.sh -s) :
+  python -m tempest.api.fgcloud.multisite --config-dir ../config \\
+      --sites site1.conf,site2.conf tempest.api.fgcloud.test_basic_scenario
+"""
+import argparse
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+from tempest.api.fgcloud import concurrency
+from tempest.api.fgcloud import nagios
+
+# From the best to the worst status
+SEVERITY = (nagios.STATUS_OK, nagios.STATUS_DEPENDENT, nagios.STATUS_UNKNOWN,
+            nagios.STATUS_WARNING, nagios.STATUS_CRITICAL)
+
+MAX_STDERR_LINES = 20
+
+
+def site_name(conf_file):
+    name = os.path.basename(conf_file)
+    if name.endswith('.conf'):
+        name = name[:-len('.conf')]
+    return name
+
+
+def worst_status(statuses):
+    if not statuses:
+        return nagios.STATUS_UNKNOWN
+    return max(statuses, key=SEVERITY.index)
+
+
+def prefix_perfdata(site, perfdata_line):
+    return ' '.join('%s_%s' % (site, item)
+                    for item in perfdata_line.split())
+
+
+def read_result(path):
+    """Return (status, output, perfdata) from a daemon.py result file"""
+    with open(path) as f:
+        lines = f.read().rstrip('\n').split('\n')
+    status = int(lines[0])
+    perfdata_line = lines[-1].split(' | ', 1)[-1]
+    return status, '\n'.join(lines[1:-1]), perfdata_line
+
+
+class Site(object):
+
+    def __init__(self, conf_file, args, work_dir):
+        self.conf_file = conf_file
+        self.name = site_name(conf_file)
+        self.args = args
+        self.result_file = os.path.join(work_dir, '%s.result' % self.name)
+        self.log_file = os.path.join(work_dir, '%s.log' % self.name)
+        self.elapsed = 0.0
+
+    def command(self):
+        args = self.args
+        check_key = '%s %s' % (self.name, ''.join(args.tests) +
+                               (args.regex or ''))
+        cmd = [sys.executable, '-m', 'tempest.api.fgcloud.daemon', '--once',
+               '--result-file', self.result_file,
+               '--maxtime', str(args.maxtime),
+               '--check-key', check_key, '--baseline', str(args.baseline)]
+        for option in ('history', 'thresholds', 'reap'):
+            value = getattr(args, option)
+            if value is not None:
+                cmd.extend(['--%s' % option, str(value)])
+        if args.regex:
+            cmd.extend(['--regex', args.regex])
+        return cmd + list(args.tests)
+
+    def run(self):
+        """Run the check of the site, return (status, output, perfdata)"""
+        start = time.time()
+        if not os.path.isfile(self.conf_file):
+            return (nagios.STATUS_UNKNOWN, '%s not found' % self.conf_file,
+                    nagios.NO_PERFDATA)
+        env = dict(os.environ)
+        env['TEMPEST_CONFIG_DIR'] = os.path.dirname(self.conf_file)
+        env['TEMPEST_CONFIG'] = os.path.basename(self.conf_file)
+        env.pop('FGCLOUD_PERFDATA_FILE', None)
+        with open(self.log_file, 'w') as log:
+            process = subprocess.Popen(self.command(), env=env, stdout=log,
+                                       stderr=subprocess.STDOUT)
+            timer = threading.Timer(self.args.timeout, process.kill)
+            timer.start()
+            try:
+                process.wait()
+            finally:
+                timer.cancel()
+        self.elapsed = time.time() - start
+
+        if os.path.isfile(self.result_file):
+            return read_result(self.result_file)
+        if self.elapsed >= self.args.timeout:
+            reason = 'Killed after %ds' % self.args.timeout
+        else:
+            reason = 'The check exited with %d' % process.returncode
+        with open(self.log_file) as log:
+            lines = log.read().splitlines()[-MAX_STDERR_LINES:]
+        return (nagios.STATUS_UNKNOWN, '\n'.join([reason] + lines),
+                nagios.NO_PERFDATA)
+
+
+def aggregate(sites, results):
+    """Return the worst (status, output, perfdata) of the sites' results"""
+    statuses = [results[site.name][0] for site in sites]
+    status = worst_status(statuses)
+    summary = []
+    out = []
+    perfdata = []
+    for site in sites:
+        site_status, output, perfdata_line = results[site.name]
+        summary.append('%s %s' % (site.name, nagios.STATUS_ALL[site_status]))
+        out.append('============== %s : %s (%.0fs) ==============' % (
+            site.name, nagios.STATUS_ALL[site_status], site.elapsed))
+        out.append(output)
+        perfdata.append(prefix_perfdata(site.name, perfdata_line))
+    nb_ko = len([s for s in statuses if s != nagios.STATUS_OK])
+    sites_perfdata = 'nb_sites=%d;;;; nb_sites_ko=%d;;;;' % (
+        len(sites), nb_ko)
+    perfdata.insert(0, sites_perfdata)
+    out.insert(0, '%s : %d sites, %s' % (nagios.STATUS_ALL[status],
+                                         len(sites), ', '.join(summary)))
+    return status, '\n'.join(out), ' '.join(perfdata)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Run the same check against several sites at once')
+    parser.add_argument('tests', nargs='*', help='Test id(s) to run')
+    parser.add_argument('--regex',
+                        help='Run the tempest tests matching the regex')
+    parser.add_argument('--sites', required=True,
+                        help='Comma separated tempest.conf files')
+    parser.add_argument('--config-dir', default='.',
+                        help='Directory of the tempest.conf files')
+    parser.add_argument('--timeout', type=int, default=900,
+                        help='Kill the check of a site after this time')
+    parser.add_argument('--maxtime', type=int, default=180,
+                        help='Raise a WARNING if the test(s) run longer')
+    parser.add_argument('--reap', type=int, metavar='MAX_AGE',
+                        help='Delete the leaked test resources older than '
+                             'MAX_AGE seconds first')
+    parser.add_argument('--history',
+                        help='Store the run of each site in this database')
+    parser.add_argument('--baseline', type=int, default=0,
+                        help='Raise a WARNING on durations significantly '
+                             'above those of the last BASELINE runs')
+    parser.add_argument('--thresholds',
+                        help='Warning and critical limits per phase and per '
+                             'test (see config/thresholds.txt.sample)')
+    args = parser.parse_args(argv)
+    if not args.tests and not args.regex:
+        parser.error('a test id or a regex is required')
+
+    conf_files = [os.path.realpath(os.path.join(args.config_dir, name))
+                  for name in args.sites.split(',') if name]
+    work_dir = tempfile.mkdtemp(prefix='fgcloud_sites.')
+    try:
+        sites = [Site(conf_file, args, work_dir) for conf_file in conf_files]
+        names = [site.name for site in sites]
+        if len(set(names)) != len(names):
+            parser.error('two sites have the same name')
+
+        graph = concurrency.TaskGraph(max_workers=max(1, len(sites)))
+        for site in sites:
+            graph.add(site.name, site.run)
+        graph.run(raise_on_error=False)
+        results = dict(graph.results)
+        for name, exc_info in graph.errors.items():
+            results[name] = (nagios.STATUS_UNKNOWN,
+                             'Cannot run the check : %s' % exc_info[1],
+                             nagios.NO_PERFDATA)
+        status, output, perfdata = aggregate(sites, results)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+    print(nagios.format_output(status, output, perfdata))
+    return status
+
+
+if __name__ == '__main__':
+    sys.exit(main())
+
+# EOF
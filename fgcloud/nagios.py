@@ -0,0 +1,505 @@
+# Copyright 2015 France-Grilles - IDGC - CNRS
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+"""Filter a subunit v2 stream and present it to Nagios/Icinga
+
+The stream is read once, on the fly, and only what is needed for the output
+is kept : counters, skipped tests, details of the failures and the last lines
+of captured logging.
+
+Usage (from the tempest directory) :
+  python -m subunit.run <test.id> 2>&1 | python -m tempest.api.fgcloud.nagios
+"""
+import argparse
+import collections
+import os
+import re
+import sqlite3
+import sys
+
+import subunit
+import testtools
+
+from tempest.api.fgcloud import history as fg_history
+from tempest.api.fgcloud import thresholds as fg_thresholds
+
+STATUS_OK = 0
+STATUS_WARNING = 1
+STATUS_CRITICAL = 2
+STATUS_UNKNOWN = 3
+STATUS_DEPENDENT = 4
+STATUS_ALL = ('OK', 'WARNING', 'CRITICAL', 'UNKNOWN', 'DEPENDENT')
+
+# Log output from tests (see tempest.conf/[DEFAULT]/default_log_levels)
+LOG_PATTERN = re.compile(r'^2[0-9]{3}-')
+# Attachments that are not part of the failure details
+IGNORED_DETAILS = ('pythonlogging', 'reason')
+
+MAX_LOG_LINES = 500
+MAX_DETAIL_LINES = 100
+MAX_SKIPPED = 200
+MAX_FAILURES = 50
+
+HISTORY_ERRORS = (sqlite3.Error, OSError, IOError)
+
+# Perfdata samples, see perfdata.add_samples
+SAMPLE_PATTERN = re.compile(r'^([^=~\s]+)~([0-9.eE+-]+)([a-zA-Z%]*)$')
+
+NO_TEST = "The test run didn't actually run any tests"
+NO_PERFDATA = ("exec_time=0s;;;; nb_tests=0;;;; nb_tests_ok=0;;;; "
+               "nb_tests_ko=0;;;; nb_skipped=0;;;;")
+
+
+def cleanup_test_name(name):
+    """Remove the [id-...,smoke] tags like subunit-trace does"""
+    tags_start = name.find('[')
+    tags_end = name.find(']')
+    if tags_start > 0 and tags_end > tags_start:
+        name = name[:tags_start] + name[tags_end + 1:]
+    return name
+
+
+class NagiosResult(testtools.StreamResult):
+    """Single pass StreamResult, with bounded memory usage"""
+
+    def __init__(self, max_log_lines=MAX_LOG_LINES,
+                 max_detail_lines=MAX_DETAIL_LINES):
+        super(NagiosResult, self).__init__()
+        self.max_detail_lines = max_detail_lines
+        self.counts = dict.fromkeys(
+            ('success', 'skip', 'xfail', 'uxsuccess', 'fail'), 0)
+        self.skipped = []
+        self.failures = []
+        # (name, status, duration in seconds) of each test, for the history
+        self.tests = []
+        self.logs = collections.deque(maxlen=max_log_lines)
+        self.nb_logs = 0
+        self.stdout = collections.deque(maxlen=max_log_lines)
+        self.start_time = None
+        self.stop_time = None
+        self._running = {}
+        self._partial = {}
+
+    @property
+    def elapsed(self):
+        if self.start_time is None or self.stop_time is None:
+            return 0.0
+        return (self.stop_time - self.start_time).total_seconds()
+
+    @property
+    def nb_tests(self):
+        return sum(self.counts.values())
+
+    def _add_log(self, line):
+        self.nb_logs += 1
+        self.logs.append(line)
+
+    def _split_lines(self, key, data, eof):
+        # Attachments come in chunks, keep the end of an incomplete line
+        data = self._partial.pop(key, b'') + data
+        lines = data.split(b'\n')
+        rest = lines.pop()
+        if eof:
+            if rest:
+                lines.append(rest)
+        elif rest:
+            self._partial[key] = rest[-4096:]
+        return [line.decode('utf-8', 'replace').rstrip('\r')
+                for line in lines]
+
+    def status(self, test_id=None, test_status=None, test_tags=None,
+               runnable=True, file_name=None, file_bytes=None, eof=False,
+               mime_type=None, route_code=None, timestamp=None):
+        super(NagiosResult, self).status(
+            test_id=test_id, test_status=test_status, test_tags=test_tags,
+            runnable=runnable, file_name=file_name, file_bytes=file_bytes,
+            eof=eof, mime_type=mime_type, route_code=route_code,
+            timestamp=timestamp)
+
+        # Output that is not part of a test (stderr, ostestr messages...)
+        if test_id is None:
+            if file_bytes:
+                for line in self._split_lines(None, file_bytes, eof):
+                    if LOG_PATTERN.match(line):
+                        self._add_log(line)
+                    elif line.strip():
+                        self.stdout.append(line)
+            return
+
+        if timestamp is not None:
+            if self.start_time is None or timestamp < self.start_time:
+                self.start_time = timestamp
+            if self.stop_time is None or timestamp > self.stop_time:
+                self.stop_time = timestamp
+
+        test = self._running.setdefault(test_id, {
+            'start': timestamp, 'tags': set(), 'details': {}})
+        if test_tags:
+            test['tags'].update(test_tags)
+
+        if file_name is not None and file_bytes:
+            lines = self._split_lines((test_id, file_name), file_bytes, eof)
+            if file_name == 'pythonlogging':
+                for line in lines:
+                    if LOG_PATTERN.match(line):
+                        self._add_log(line)
+            else:
+                detail = test['details'].setdefault(
+                    file_name, collections.deque(
+                        maxlen=self.max_detail_lines))
+                detail.extend(lines)
+
+        if test_status in self.counts:
+            self._running.pop(test_id)
+            self._stop_test(test_id, test_status, test, timestamp)
+        elif test_status == 'exists':
+            self._running.pop(test_id)
+
+    def _stop_test(self, test_id, test_status, test, timestamp):
+        for key in list(self._partial):
+            if isinstance(key, tuple) and key[0] == test_id:
+                name = key[1]
+                lines = self._split_lines(key, b'', True)
+                test['details'].setdefault(name, collections.deque(
+                    maxlen=self.max_detail_lines)).extend(lines)
+        self.counts[test_status] += 1
+
+        worker = '0'
+        for tag in test['tags']:
+            if tag.startswith('worker-'):
+                worker = tag[len('worker-'):]
+        duration = ''
+        seconds = None
+        if test['start'] is not None and timestamp is not None:
+            seconds = (timestamp - test['start']).total_seconds()
+            duration = '%fs' % seconds
+        name = cleanup_test_name(test_id)
+        self.tests.append((name, test_status, seconds))
+
+        if test_status == 'skip':
+            reason = ' '.join(test['details'].get('reason', [])).strip()
+            if len(self.skipped) < MAX_SKIPPED:
+                self.skipped.append('{%s} %s ... SKIPPED: %s' %
+                                    (worker, name, reason))
+            else:
+                self.skipped.append(None)
+        elif test_status in ('fail', 'uxsuccess'):
+            lines = ['{%s} %s [%s] ... FAILED' % (worker, name, duration)]
+            for detail, content in sorted(test['details'].items()):
+                if detail in IGNORED_DETAILS:
+                    continue
+                content = [line for line in content
+                           if line.strip() and not LOG_PATTERN.match(line)]
+                if not content:
+                    continue
+                if detail != 'traceback':
+                    lines.append('Captured %s:' % detail)
+                lines.extend('    ' + line for line in content)
+            if len(self.failures) < MAX_FAILURES:
+                self.failures.append(lines)
+            else:
+                self.failures.append(None)
+
+    def stopTestRun(self):
+        super(NagiosResult, self).stopTestRun()
+        for line in self._split_lines(None, b'', True):
+            if LOG_PATTERN.match(line):
+                self._add_log(line)
+
+
+def read_perfdata(path):
+    """Return the values sent by the tests (see fgcloud/perfdata.py)
+
+    The samples of a label, from all the processes of the run, are sent as
+    <label>_p50, _p95, _max and _count.
+    """
+    values = []
+    by_label = collections.OrderedDict()
+    if path and os.path.isfile(path):
+        with open(path) as f:
+            for line in f:
+                line = line.strip()
+                match = SAMPLE_PATTERN.match(line)
+                if match:
+                    label, value, unit = match.groups()
+                    by_label.setdefault((label, unit), []).append(
+                        float(value))
+                elif line:
+                    values.append(line + ';;;;')
+    for (label, unit), samples in by_label.items():
+        # 3 decimals, the fast API calls would be 0.00s
+        for name, value in (('p50', fg_history.percentile(samples, 50)),
+                            ('p95', fg_history.percentile(samples, 95)),
+                            ('max', max(samples))):
+            values.append('%s_%s=%.3f%s;;;;' % (label, name, value, unit))
+        values.append('%s_count=%d;;;;' % (label, len(samples)))
+    return values
+
+
+def _limited(label, value, unit, limits):
+    warning, critical = limits
+    return '%s=%s%s;%s;%s;;' % (label, value, unit,
+                                fg_thresholds.format_limit(warning),
+                                fg_thresholds.format_limit(critical))
+
+
+def apply_thresholds(thresholds, result, extra_perfdata):
+    """Add the limits to the perfdata, return (perfdata, breaches)
+
+    Each test with a limit gets a <test method>_time value. breaches are the
+    (level, message) of the values above their limit.
+    """
+    perfdata = []
+    breaches = []
+
+    def check(label, value, unit, limits):
+        breach = fg_thresholds.check(label, float(value), unit, limits)
+        if breach:
+            breaches.append(breach)
+
+    for item in extra_perfdata:
+        match = fg_history.PERFDATA_PATTERN.match(item)
+        limits = match and thresholds.get('phase', match.group(1))
+        if not limits:
+            perfdata.append(item)
+            continue
+        label, value, unit = match.groups()
+        perfdata.append(_limited(label, value, unit, limits))
+        check(label, value, unit, limits)
+
+    for name, test_status, seconds in result.tests:
+        limits = thresholds.get('test', name)
+        if not limits or seconds is None or test_status == 'skip':
+            continue
+        label = '%s_time' % name.rsplit('.', 1)[-1]
+        perfdata.append(_limited(label, '%.2f' % seconds, 's', limits))
+        check(name, round(seconds, 2), 's', limits)
+    return perfdata, breaches
+
+
+def build_output(result, maxtime, extra_perfdata=(), warnings=(),
+                 thresholds=None):
+    """Compute the Nagios status, output text and perfdata of a run
+
+    warnings are extra reasons to raise a WARNING (ie. slowdowns). With
+    thresholds (see fgcloud/thresholds.py), an exec_time limit replaces
+    maxtime.
+    """
+    if result.nb_tests == 0:
+        out = [NO_TEST] + list(result.stdout) + list(result.logs)
+        return STATUS_UNKNOWN, '\n'.join(out), NO_PERFDATA
+
+    passed = result.counts['success']
+    skipped = result.counts['skip']
+    exfail = result.counts['xfail']
+    unexok = result.counts['uxsuccess']
+    failed = result.counts['fail']
+    time = int(result.elapsed)
+
+    nb_ok = passed + exfail
+    nb_ko = unexok + failed
+    info = ('exec_time=%ds nb_tests=%d nb_tests_ok=%d nb_tests_ko=%d '
+            'nb_skipped=%d' % (time, result.nb_tests, nb_ok, nb_ko, skipped))
+    exec_time = 'exec_time=%ds;;;;' % time
+    breaches = []
+    exec_limits = None
+    if thresholds is not None:
+        extra_perfdata, breaches = apply_thresholds(thresholds, result,
+                                                    extra_perfdata)
+        exec_limits = thresholds.get('phase', 'exec_time')
+    if exec_limits:
+        exec_time = _limited('exec_time', time, 's', exec_limits)
+        breach = fg_thresholds.check('exec_time', time, 's', exec_limits)
+        if breach:
+            breaches.insert(0, breach)
+    too_long = time > maxtime if not exec_limits else False
+    perfdata = ('%s nb_tests=%d;;;; nb_tests_ok=%d;;;; nb_tests_ko=%d;;;; '
+                'nb_skipped=%d;;;;' %
+                (exec_time, result.nb_tests, nb_ok, nb_ko, skipped))
+    if extra_perfdata:
+        perfdata += ' ' + ' '.join(extra_perfdata)
+
+    # Compute output status
+    if nb_ko > 0:
+        status = STATUS_WARNING
+    else:
+        status = STATUS_OK
+    if passed > 0 or exfail > 0:
+        status = STATUS_OK
+
+    # Throw a Warning
+    if too_long or skipped > 0 or unexok > 0 or warnings or breaches:
+        status = STATUS_WARNING
+
+    out = []
+    if result.logs:
+        out.append('-------------- Captured logging --------------')
+        if result.nb_logs > len(result.logs):
+            out.append('(%d older lines not shown)' %
+                       (result.nb_logs - len(result.logs)))
+        out.extend(result.logs)
+
+    # Add list of skipped tests
+    if skipped > 0:
+        out.append('-------------- Skipped Tests --------------')
+        out.extend(line for line in result.skipped if line is not None)
+        if None in result.skipped:
+            out.append('(%d more skipped tests)' % result.skipped.count(None))
+
+    if warnings:
+        out.append('-------------- Warnings --------------')
+        out.extend(warnings)
+
+    if breaches:
+        out.append('-------------- Thresholds --------------')
+        out.extend(message for _, message in breaches)
+
+    # Add details about the failed tests
+    if failed > 0:
+        status = STATUS_CRITICAL
+
+        out.append('-------------- Details / Trace --------------')
+        for lines in result.failures:
+            if lines is not None:
+                out.append('')
+                out.extend(lines)
+        if None in result.failures:
+            out.append('(%d more failed tests)' % result.failures.count(None))
+        out.append('')
+    if any(level == 'critical' for level, _ in breaches):
+        status = STATUS_CRITICAL
+
+    # Add a summary
+    out.append('-------------- Summary --------------')
+    out.append('Ran: %d tests in %.4f sec.' % (result.nb_tests,
+                                               result.elapsed))
+    out.append(' - Passed: %d' % passed)
+    out.append(' - Skipped: %d' % skipped)
+    out.append(' - Expected Fail: %d' % exfail)
+    out.append(' - Unexpected Success: %d' % unexok)
+    out.append(' - Failed: %d' % failed)
+
+    # Add a header
+    header = '%s : %s' % (STATUS_ALL[status], info)
+    if breaches:
+        header += ' - %s' % ', '.join(message for _, message in breaches)
+    out.insert(0, header)
+    return status, '\n'.join(out), perfdata
+
+
+def evaluate(result, maxtime, extra_perfdata=(), history_path=None,
+             check_key=None, baseline=0, thresholds=None):
+    """build_output, with the run stored in the history database
+
+    With a baseline, the durations are compared with the last baseline
+    runs of the same check_key (see fgcloud/history.py).
+    """
+    if not history_path or not check_key or result.nb_tests == 0:
+        return build_output(result, maxtime, extra_perfdata,
+                            thresholds=thresholds)
+
+    metrics = fg_history.parse_perfdata(extra_perfdata)
+    metrics.append(('exec_time', result.elapsed, 's'))
+    # The history is an add-on, the check goes on without it
+    history = None
+    error = None
+    warnings = []
+    try:
+        history = fg_history.History(history_path)
+        if baseline:
+            warnings = history.regressions(check_key, metrics, baseline)
+    except HISTORY_ERRORS as exc:
+        error = exc
+    status, output, perfdata = build_output(
+        result, maxtime, extra_perfdata, warnings, thresholds)
+    if history is not None:
+        try:
+            if error is None:
+                history.record(check_key, status, result.elapsed,
+                               result.tests, metrics)
+        except HISTORY_ERRORS as exc:
+            error = exc
+        finally:
+            history.close()
+    if error is not None:
+        # Not on stderr, it could come before the status line
+        output += '\nHistory %s unavailable : %s' % (history_path, error)
+    return status, output, perfdata
+
+
+def format_output(status, output, perfdata):
+    return '%s\nStatus : exit %d (%s) | %s' % (output, status,
+                                               STATUS_ALL[status], perfdata)
+
+
+def parse_stream(stream, result=None):
+    """Feed a subunit v2 byte stream to a NagiosResult"""
+    if result is None:
+        result = NagiosResult()
+    case = subunit.ByteStreamToStreamResult(stream, non_subunit_name='stdout')
+    result.startTestRun()
+    try:
+        case.run(result)
+    finally:
+        result.stopTestRun()
+    return result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Filter a subunit v2 stream for Nagios/Icinga')
+    parser.add_argument('--maxtime', type=int, default=180,
+                        help='Raise a WARNING if the test(s) run longer')
+    parser.add_argument('--perfdata-file',
+                        default=os.environ.get('FGCLOUD_PERFDATA_FILE'),
+                        help='Values sent by the tests to add to perfdata')
+    parser.add_argument('--history',
+                        help='Store the run in this SQLite database')
+    parser.add_argument('--check-key',
+                        help='Name of the check in the history')
+    parser.add_argument('--baseline', type=int, default=0,
+                        help='Raise a WARNING on durations significantly '
+                             'above those of the last BASELINE runs')
+    parser.add_argument('--thresholds',
+                        help='Warning and critical limits per phase and per '
+                             'test (see config/thresholds.txt.sample)')
+    args = parser.parse_args(argv)
+
+    thresholds = None
+    error = None
+    if args.thresholds:
+        try:
+            thresholds = fg_thresholds.Thresholds.load(args.thresholds)
+        except (IOError, ValueError, re.error) as exc:
+            error = exc
+    # Read the whole stream anyway, the tests would die on a closed pipe
+    # before their cleanups
+    stream = getattr(sys.stdin, 'buffer', sys.stdin)
+    result = parse_stream(stream)
+    if error is not None:
+        status, output, perfdata = (
+            STATUS_UNKNOWN, 'Invalid thresholds file : %s' % error,
+            NO_PERFDATA)
+    else:
+        status, output, perfdata = evaluate(
+            result, args.maxtime, read_perfdata(args.perfdata_file),
+            args.history, args.check_key, args.baseline, thresholds)
+    print(format_output(status, output, perfdata))
+    return status
+
+
+if __name__ == '__main__':
+    sys.exit(main())
+
+# EOF
@@ -0,0 +1,100 @@
+# Copyright 2015 France-Grilles - IDGC - CNRS
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+"""Latency and TCP throughput between two servers (see test_network_probe)
+
+Only ping, nc, dd and sh are needed in the image, as in cirros. The sender
+streams zeros to nc for [fgcloud]/network_probe_runtime seconds, 1 MB at a
+time, and the receiver drops them: the throughput is the data written by the
+sender over the time it took, measured in the server from /proc/uptime.
+"""
+import re
+
+from tempest.api.fgcloud import history
+from tempest.api.fgcloud import options  # noqa
+from tempest import config
+
+CONF = config.CONF
+
+PING_PATTERN = re.compile(r'time[=<]([0-9.]+) ?ms')
+
+CHUNK_MB = 1
+RESULT_FILE = '/tmp/fgcloud_probe'
+
+# busybox nc wants '-l -p PORT', openbsd nc '-l PORT'. The sleep leaves
+# time to nc to listen before the sender connects
+RECEIVER = ("sh -c '(nc -l -p %(port)d || nc -l %(port)d) "
+            "< /dev/null > /dev/null 2>&1 & sleep 1'")
+
+# Prints '<start> <chunks sent> <end>', times from /proc/uptime
+SENDER = (
+    "sh -c '"
+    "rm -f %(result)s.start %(result)s.end; "
+    "(read s r < /proc/uptime; echo $s > %(result)s.start; n=0; "
+    "stop=$(($(date +%%s) + %(runtime)d)); "
+    "while [ $(date +%%s) -lt $stop ]; do "
+    "dd if=/dev/zero bs=64k count=16 2>/dev/null || break; n=$((n + 1)); "
+    "done; "
+    "read e r < /proc/uptime; echo $n $e > %(result)s.end) "
+    "| nc %(ip)s %(port)d > /dev/null 2>&1 & "
+    "i=0; while [ ! -s %(result)s.end ] && [ $i -lt %(wait)d ]; do "
+    "sleep 1; i=$((i + 1)); done; "
+    "kill $! 2>/dev/null; "
+    "echo $(cat %(result)s.start) $(cat %(result)s.end)'")
+
+
+def ping_command(ip):
+    # ping exits with 1 on packet loss
+    return 'ping -c %d %s || true' % (CONF.fgcloud.network_probe_pings, ip)
+
+
+def parse_ping(output):
+    """Return (RTTs in ms, loss in %)"""
+    rtts = [float(rtt) for rtt in PING_PATTERN.findall(output)]
+    count = CONF.fgcloud.network_probe_pings
+    loss = 100.0 * max(0, count - len(rtts)) / count
+    return rtts, loss
+
+
+def rtt_stats(rtts):
+    """Return [(name, value in ms)]: min, median, p95 and max"""
+    return [('min', min(rtts)),
+            ('median', history.percentile(rtts, 50)),
+            ('p95', history.percentile(rtts, 95)),
+            ('max', max(rtts))]
+
+
+def receiver_command():
+    return RECEIVER % {'port': CONF.fgcloud.network_probe_port}
+
+
+def sender_command(ip):
+    runtime = CONF.fgcloud.network_probe_runtime
+    return SENDER % {'result': RESULT_FILE, 'ip': ip,
+                     'port': CONF.fgcloud.network_probe_port,
+                     'runtime': runtime, 'wait': runtime + 30}
+
+
+def parse_sender(output):
+    """Return the throughput in MB/s, None if nothing was sent"""
+    fields = output.split()
+    if len(fields) < 3:
+        return None
+    start, chunks, end = fields[-3:]
+    elapsed = max(float(end) - float(start), 0.01)
+    if not int(chunks):
+        return None
+    return int(chunks) * CHUNK_MB / elapsed
+
+# EOF
@@ -0,0 +1,171 @@
+# Copyright 2015 France-Grilles - IDGC - CNRS
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+"""Options of the fgcloud tests, in the [fgcloud] section of tempest.conf
+
+Import this module before using CONF.fgcloud
+"""
+from oslo_config import cfg
+
+fgcloud_group = cfg.OptGroup(name='fgcloud',
+                             title='FG Cloud monitoring options')
+
+FgcloudGroup = [
+    cfg.BoolOpt('concurrent_provisioning',
+                default=False,
+                help="Create the resources of test_basic_scenario that do "
+                     "not depend on each other (keypair and server, volume, "
+                     "security group, floating IP) in parallel."),
+    cfg.FloatOpt('poll_initial_interval',
+                 default=0.5,
+                 help="Time in seconds before the second poll of a "
+                      "resource status, see fgcloud/waiters.py."),
+    cfg.FloatOpt('poll_backoff',
+                 default=1.5,
+                 help="Factor applied to the interval between two polls "
+                      "after each poll."),
+    cfg.FloatOpt('poll_max_interval',
+                 default=10.0,
+                 help="Maximum time in seconds between two polls of a "
+                      "resource status."),
+    cfg.IntOpt('list_page_size',
+               default=50,
+               help="Number of servers and volumes listed to measure the "
+                    "list latency (0 for the full lists). The existence "
+                    "checks use a filter on the name instead."),
+    cfg.BoolOpt('canary_pool',
+                default=False,
+                help="Run test_canary_pool: data plane checks (SSH, volume "
+                     "read/write, reboot) on long-lived canary resources "
+                     "that are only created again when unhealthy."),
+    cfg.StrOpt('canary_state_file',
+               default='/var/tmp/fgcloud/canary.json',
+               help="File storing the ids of the canary resources, one "
+                    "entry per account."),
+    cfg.IntOpt('canary_max_age',
+               default=24,
+               help="Create new canaries when they are older than this "
+                    "number of hours (0 to keep them forever)."),
+    cfg.BoolOpt('canary_reboot',
+                default=False,
+                help="Also reboot the canary server and check the volume "
+                     "content after the reboot."),
+    cfg.IntOpt('max_workers',
+               default=8,
+               help="Maximum number of API calls or waits run in parallel "
+                    "by a test."),
+    cfg.BoolOpt('concurrent_isolation_checks',
+                default=False,
+                help="Send the API calls of the test_user_isolation_run "
+                     "checks in parallel (up to max_workers) when the "
+                     "fixtures are received, then report each result in "
+                     "its own test."),
+    cfg.BoolOpt('isolation_run_server',
+                default=True,
+                help="Boot VM_Run on the test_user_isolation_run side, only "
+                     "used to check the attachment of a volume of the other "
+                     "user (skipped otherwise)."),
+    cfg.IntOpt('isolation_timeout',
+               default=1800,
+               help="Time in seconds the isolation setup and run tests wait "
+                    "for each other, see check_isolation.sh."),
+    cfg.BoolOpt('token_cache',
+                default=False,
+                help="Share the Keystone tokens between the checks through "
+                     "files, see fgcloud/token_cache.py."),
+    cfg.StrOpt('token_cache_dir',
+               default='/var/tmp/fgcloud/tokens',
+               help="Directory of the cached tokens, only readable by its "
+                    "owner."),
+    cfg.IntOpt('token_cache_margin',
+               default=300,
+               help="Get a new token when the cached one expires in less "
+                    "than this number of seconds."),
+    cfg.BoolOpt('api_latency',
+                default=False,
+                help="Time each REST call of the tests and send the p50, "
+                     "p95 and max latency of each service as perfdata, see "
+                     "fgcloud/api_latency.py."),
+    cfg.ListOpt('api_latency_endpoints',
+                default=[],
+                help="Endpoints that also get their own latency perfdata, "
+                     "as <service>_<method>_<endpoint> (ie. "
+                     "compute_post_servers, volume_get_volumes_id)."),
+    cfg.BoolOpt('http_keep_alive',
+                default=True,
+                help="Share keep-alive HTTP connections between all the "
+                     "clients of a check instead of a new connection per "
+                     "request, see fgcloud/http_pool.py."),
+    cfg.BoolOpt('volume_benchmark',
+                default=False,
+                help="Run an I/O benchmark on the attached volume at the "
+                     "end of test_basic_scenario and send the MB/s, IOPS "
+                     "and latency as perfdata, see fgcloud/volume_bench.py. "
+                     "The data of the volume are overwritten."),
+    cfg.ListOpt('volume_benchmark_workloads',
+                default=['seq_write', 'seq_read', 'rand_write', 'rand_read'],
+                help="Workloads of the volume benchmark, among seq_read, "
+                     "seq_write, rand_read and rand_write."),
+    cfg.IntOpt('volume_benchmark_runtime',
+               default=10,
+               help="Time in seconds of each workload, lower than the "
+                    "SSH channel timeout [validation]/connect_timeout."),
+    cfg.IntOpt('volume_benchmark_size',
+               default=256,
+               help="Size in MB of the region of the volume used by the "
+                    "benchmark, at most the volume size."),
+    cfg.IntOpt('volume_benchmark_block_size',
+               default=4,
+               help="Block size in KB of the random workloads, the "
+                    "sequential ones use 1 MB blocks."),
+    cfg.BoolOpt('network_probe',
+                default=False,
+                help="Run test_network_probe: RTT and TCP throughput "
+                     "between two servers, over the private network and "
+                     "over the floating IPs."),
+    cfg.IntOpt('network_probe_pings',
+               default=10,
+               help="Number of pings (one per second) of each RTT "
+                    "measurement."),
+    cfg.IntOpt('network_probe_runtime',
+               default=10,
+               help="Time in seconds of each TCP throughput measurement, "
+                    "lower than the SSH channel timeout "
+                    "[validation]/connect_timeout."),
+    cfg.IntOpt('network_probe_port',
+               default=5001,
+               help="TCP port of the throughput measurement, opened in "
+                    "the security group of the probe servers."),
+    cfg.BoolOpt('boot_storm',
+                default=False,
+                help="Run test_boot_storm: boot boot_storm_count servers "
+                     "at once and report the distribution of their "
+                     "time-to-ACTIVE and time-to-SSH."),
+    cfg.IntOpt('boot_storm_count',
+               default=5,
+               help="Number of servers booted at once by test_boot_storm."),
+    cfg.BoolOpt('boot_storm_ssh',
+                default=True,
+                help="Also measure the time-to-SSH of each server, needs "
+                     "one floating IP per server."),
+    cfg.IntOpt('boot_storm_max_failures',
+               default=0,
+               help="Number of servers of the boot storm that may fail "
+                    "(ERROR, timeout, no SSH) without failing the test."),
+]
+
+cfg.CONF.register_group(fgcloud_group)
+cfg.CONF.register_opts(FgcloudGroup, group=fgcloud_group)
+
+# EOF
@@ -0,0 +1,95 @@
+# Copyright 2015 France-Grilles - IDGC - CNRS
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+import atexit
+import contextlib
+import os
+import threading
+import time
+from oslo_log import log as logging
+
+LOG = logging.getLogger(__name__)
+
+# check_openstack.sh exports this variable, each value added by the tests is
+# appended to the file then merged into the Nagios perfdata line
+PERFDATA_ENV = 'FGCLOUD_PERFDATA_FILE'
+
+# Samples are written as '<label>~<value><unit>', nagios.py sends their
+# distribution (see add_samples)
+SAMPLE_SEP = '~'
+
+_lock = threading.Lock()
+_flush_hooks = []
+
+
+def add(label, value, unit=''):
+    """Record a perfdata value, ie. add('boot_time', 12.3, 's')"""
+    if isinstance(value, float):
+        value = '%.2f' % value
+    line = '%s=%s%s' % (label, value, unit)
+    LOG.info('Perfdata : %s' % line)
+
+    _write([line])
+
+
+def add_samples(label, values, unit=''):
+    """Record raw values, ie. add_samples('api_compute', [0.12, 0.3], 's')
+
+    nagios.py sends <label>_p50, _p95, _max and _count computed over the
+    samples of all the processes of the run (ie. the parallel workers).
+    """
+    _write(['%s%s%.6f%s' % (label, SAMPLE_SEP, value, unit)
+            for value in values])
+
+
+def _write(lines):
+    path = os.environ.get(PERFDATA_ENV)
+    if not path or not lines:
+        return
+    with _lock:
+        with open(path, 'a') as f:
+            f.write(''.join(line + '\n' for line in lines))
+
+
+@contextlib.contextmanager
+def timer(label):
+    """Time the enclosed block and record it as '<label>=<sec>s'"""
+    start = time.time()
+    try:
+        yield
+    finally:
+        add(label, time.time() - start, 's')
+
+
+def on_flush(func):
+    """Register a function that adds aggregated values when flushing
+
+    Used for values summed over a whole run (ie. the polls of the waiters)
+    """
+    if func not in _flush_hooks:
+        _flush_hooks.append(func)
+
+
+def flush():
+    """Add the aggregated values, at exit or at the end of a daemon run"""
+    for func in _flush_hooks:
+        try:
+            func()
+        except Exception:
+            LOG.exception("Cannot add the aggregated perfdata")
+
+
+atexit.register(flush)
+
+# EOF
@@ -0,0 +1,320 @@
+# Copyright 2015 France-Grilles - IDGC - CNRS
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+"""Delete the test resources left behind by killed or timed out runs
+
+The resources of test_basic_scenario and of the isolation tests are found
+by the prefix of their data_utils.rand_name() name, in every account of
+[auth]/test_accounts_file, and deleted in parallel when older than max_age.
+The canaries of test_canary_pool are never touched.
+
+Keypairs are deleted by the age shown by Nova. Security groups have no
+creation date: they are only deleted when the account has no test server,
+volume or snapshot at all and no recent test keypair, that is no check
+running on it (the checks create their keypair and security group first).
+
+Usage (from the tempest directory, see check_openstack.sh -r) :
+  python -m tempest.api.fgcloud.reaper --max-age 3600 [--dry-run]
+"""
+import argparse
+import re
+import sys
+import time
+
+from oslo_log import log as logging
+from oslo_utils import timeutils
+import yaml
+
+from tempest.api.fgcloud import concurrency
+from tempest.api.fgcloud import instrument
+from tempest.api.fgcloud import options  # noqa
+from tempest.api.fgcloud import perfdata
+from tempest.api.fgcloud import waiters
+from tempest import clients
+from tempest.common import credentials_factory as common_creds
+from tempest import config
+from tempest.lib import exceptions as lib_exc
+
+CONF = config.CONF
+LOG = logging.getLogger(__name__)
+
+# Names given by the fgcloud tests, data_utils.rand_name adds '-<number>'
+# (secgroup-smoke for ScenarioTest._create_security_group)
+PREFIXES = ('TestBasicScenario', 'VM_Setup', 'VM_Run', 'volume1', 'volume2',
+            'vol_snapshot', 'snapshot', 'keypair', 'security',
+            'secgroup-smoke', 'TestNetworkProbe', 'NetworkProbe',
+            'TestBootStorm', 'BootStorm')
+NAME_PATTERN = re.compile(r'^(%s)-' % '|'.join(PREFIXES))
+
+# Released by the deletion of their server, wait for them
+BUSY_VOLUME_STATUSES = ('in-use', 'attaching', 'detaching')
+
+KINDS = ('servers', 'volumes', 'snapshots', 'images', 'keypairs',
+         'secgroups')
+
+
+def _is_leaked(name):
+    return bool(name) and NAME_PATTERN.match(name) is not None
+
+
+def _age(timestamp):
+    created = timeutils.normalize_time(timeutils.parse_isotime(timestamp))
+    return timeutils.delta_seconds(created, timeutils.utcnow())
+
+
+def _name(resource):
+    return resource.get('name') or resource.get('display_name')
+
+
+def load_accounts(path):
+    with open(path) as f:
+        accounts = yaml.safe_load(f) or []
+    return [dict((key, value) for key, value in account.items()
+                 if key not in ('resources', 'roles', 'types'))
+            for account in accounts]
+
+
+class AccountReaper(object):
+    """Leaked resources of one account"""
+
+    def __init__(self, account):
+        self.account = account
+        self.label = '%s/%s' % (account.get('tenant_name') or
+                                account.get('project_name'),
+                                account['username'])
+        self.found = dict((kind, []) for kind in KINDS)
+
+    def connect(self):
+        credentials = common_creds.get_credentials(
+            identity_version=CONF.identity.auth_version, **self.account)
+        self.os = clients.Manager(credentials=credentials)
+        if CONF.volume_feature_enabled.api_v1:
+            self.volumes_client = self.os.volumes_client
+            self.snapshots_client = self.os.snapshots_client
+        else:
+            self.volumes_client = self.os.volumes_v2_client
+            self.snapshots_client = self.os.snapshots_v2_client
+
+    def find(self, max_age):
+        """List the leaked resources older than max_age seconds"""
+        self.connect()
+        # Listed first: a check that created one after this still has its
+        # keypair, server or volume in the lists below
+        secgroups_client = self.os.compute_security_groups_client
+        secgroups = secgroups_client.list_security_groups()['security_groups']
+        busy = False
+        servers = self.os.servers_client.list_servers(
+            detail=True)['servers']
+        volumes = self.volumes_client.list_volumes(detail=True)['volumes']
+        snapshots = self.snapshots_client.list_snapshots(
+            detail=True)['snapshots']
+        for kind, resources, date_key in (
+                ('servers', servers, 'created'),
+                ('volumes', volumes, 'created_at'),
+                ('snapshots', snapshots, 'created_at')):
+            for resource in resources:
+                if not _is_leaked(_name(resource)):
+                    continue
+                busy = True
+                if _age(resource[date_key]) >= max_age:
+                    self.found[kind].append(resource)
+
+        # Server snapshots only, not the images of the site
+        images = self.os.compute_images_client.list_images(
+            detail=True)['images']
+        for image in images:
+            metadata = image.get('metadata', {})
+            if (metadata.get('image_type') == 'snapshot' and
+                    _is_leaked(image['name']) and
+                    _age(image['created']) >= max_age):
+                self.found['images'].append(image)
+
+        keypairs_client = self.os.keypairs_client
+        for keypair in keypairs_client.list_keypairs()['keypairs']:
+            name = keypair['keypair']['name']
+            if not _is_leaked(name):
+                continue
+            try:
+                created = keypairs_client.show_keypair(
+                    name)['keypair'].get('created_at')
+            except lib_exc.NotFound:
+                continue
+            if created is None or _age(created) < max_age:
+                busy = True
+            else:
+                self.found['keypairs'].append(keypair['keypair'])
+
+        if busy:
+            LOG.info("%s has test resources, keeping its security groups" %
+                     self.label)
+            return
+        for secgroup in secgroups:
+            if _is_leaked(secgroup['name']):
+                self.found['secgroups'].append(secgroup)
+
+    def add_deletions(self, graph):
+        """Add one task per resource, return {task name: kind}"""
+        tasks = {}
+
+        def add(kind, resource_id, func, requires=()):
+            name = '%s %s %s' % (self.label, kind, resource_id)
+            graph.add(name, func, requires=requires)
+            tasks[name] = kind
+            return name
+
+        server_ids = set(s['id'] for s in self.found['servers'])
+        server_tasks = {}
+        for server in self.found['servers']:
+            server_tasks[server['id']] = add(
+                'servers', server['id'], self._delete_server(server['id']))
+
+        snapshot_tasks = {}
+        for snapshot in self.found['snapshots']:
+            snapshot_tasks.setdefault(snapshot['volume_id'], []).append(add(
+                'snapshots', snapshot['id'],
+                self._delete_snapshot(snapshot['id'])))
+
+        for volume in self.found['volumes']:
+            attached_to = [a['server_id']
+                           for a in volume.get('attachments', [])]
+            if any(s not in server_ids for s in attached_to):
+                LOG.warning("%s volume %s is attached to a server that is "
+                            "not reaped, skipping it" %
+                            (self.label, volume['id']))
+                continue
+            requires = [server_tasks[s] for s in attached_to]
+            requires.extend(snapshot_tasks.get(volume['id'], []))
+            add('volumes', volume['id'], self._delete_volume(volume['id']),
+                requires=requires)
+
+        for image in self.found['images']:
+            add('images', image['id'], self._delete(
+                self.os.compute_images_client.delete_image, image['id']))
+        for keypair in self.found['keypairs']:
+            add('keypairs', keypair['name'], self._delete(
+                self.os.keypairs_client.delete_keypair, keypair['name']))
+        # A security group is in use until its servers are gone
+        for secgroup in self.found['secgroups']:
+            add('secgroups', secgroup['id'], self._delete(
+                self.os.compute_security_groups_client.delete_security_group,
+                secgroup['id']), requires=list(server_tasks.values()))
+        return tasks
+
+    def _delete(self, func, resource_id):
+        def delete():
+            try:
+                func(resource_id)
+            except lib_exc.NotFound:
+                pass
+        return delete
+
+    def _delete_server(self, server_id):
+        client = self.os.servers_client
+
+        def delete():
+            try:
+                client.delete_server(server_id)
+            except lib_exc.NotFound:
+                return
+            waiters.wait_for_resource_deletion(client, server_id)
+        return delete
+
+    def _delete_snapshot(self, snapshot_id):
+        client = self.snapshots_client
+
+        def delete():
+            try:
+                client.delete_snapshot(snapshot_id)
+            except lib_exc.NotFound:
+                return
+            waiters.wait_for_resource_deletion(client, snapshot_id)
+        return delete
+
+    def _delete_volume(self, volume_id):
+        client = self.volumes_client
+
+        def delete():
+            try:
+                # Available and error volumes are deleted as they are
+                volume = client.show_volume(volume_id)['volume']
+                if volume['status'] in BUSY_VOLUME_STATUSES:
+                    waiters.wait_for_volume_status(client, volume_id,
+                                                   'available')
+                client.delete_volume(volume_id)
+            except lib_exc.NotFound:
+                pass
+        return delete
+
+
+def reap(max_age, accounts_file=None, dry_run=False, max_workers=None):
+    """Delete the leaked resources of every account, return the failures"""
+    start = time.time()
+    instrument.install_all()
+    accounts_file = accounts_file or CONF.auth.test_accounts_file
+    if max_workers is None:
+        max_workers = CONF.fgcloud.max_workers
+    reapers = [AccountReaper(account)
+               for account in load_accounts(accounts_file)]
+
+    # First list the resources of all the accounts at once
+    graph = concurrency.TaskGraph(max_workers)
+    for reaper in reapers:
+        graph.add(reaper.label, lambda r=reaper: r.find(max_age))
+    graph.run(raise_on_error=False)
+    for label, exc_info in graph.errors.items():
+        LOG.warning("Cannot list the resources of %s : %s" %
+                    (label, exc_info[1]))
+    reapers = [r for r in reapers if r.label in graph.results]
+
+    graph = concurrency.TaskGraph(max_workers, cancel_on_error=False)
+    tasks = {}
+    for reaper in reapers:
+        tasks.update(reaper.add_deletions(graph))
+    if dry_run:
+        for name in sorted(tasks):
+            LOG.info("Would delete %s" % name)
+        return []
+    graph.run(raise_on_error=False)
+
+    counts = dict((kind, 0) for kind in KINDS)
+    for name in graph.results:
+        counts[tasks[name]] += 1
+    for name, exc_info in graph.errors.items():
+        LOG.warning("Cannot delete %s : %s" % (name, exc_info[1]))
+    for kind in KINDS:
+        perfdata.add('reaped_%s' % kind, counts[kind])
+    perfdata.add('reap_failures', len(graph.errors))
+    perfdata.add('reap_time', time.time() - start, 's')
+    return list(graph.errors)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Delete the resources left behind by the fgcloud tests')
+    parser.add_argument('--max-age', type=int, default=3600,
+                        help='Only delete resources older than this number '
+                             'of seconds')
+    parser.add_argument('--accounts-file',
+                        help='Default : [auth]/test_accounts_file')
+    parser.add_argument('--dry-run', action='store_true',
+                        help='Only log what would be deleted')
+    args = parser.parse_args(argv)
+    failures = reap(args.max_age, args.accounts_file, args.dry_run)
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
+
+# EOF
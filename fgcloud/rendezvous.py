@@ -0,0 +1,165 @@
+# Copyright 2015 France-Grilles - IDGC - CNRS
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+"""Rendezvous between the isolation setup and run processes
+
+check_isolation.sh creates one channel directory per run and exports it in
+FGCLOUD_ISOLATION_CHANNEL. The setup side publishes its fixtures with an
+atomic rename then wakes up the run side through a FIFO. The run side
+removes the file once its tests are over and wakes up the setup side
+through a second FIFO.
+
+The file is the real signal, the FIFOs only avoid polling: a waiter opens
+its FIFO before checking the file, so a wake up cannot be lost.
+
+When the setup fails, it publishes its error instead of the fixtures, so
+that the run side fails at once with it rather than after its timeout.
+"""
+import errno
+import json
+import os
+import select
+import tempfile
+import time
+
+CHANNEL_ENV = 'FGCLOUD_ISOLATION_CHANNEL'
+
+FIXTURES = 'fixtures.json'
+READY = 'ready.fifo'
+DONE = 'done.fifo'
+
+# Key of the fixtures published by a failed setup
+ERROR = 'setup_error'
+
+
+class SetupError(Exception):
+    pass
+
+
+class Channel(object):
+
+    def __init__(self, default_path):
+        self.path = os.environ.get(CHANNEL_ENV) or default_path
+        if not os.path.isdir(self.path):
+            try:
+                os.makedirs(self.path, 0o700)
+            except OSError as exc:
+                if exc.errno != errno.EEXIST:
+                    raise
+        self.fixtures_path = os.path.join(self.path, FIXTURES)
+
+    def _fifo(self, name):
+        path = os.path.join(self.path, name)
+        try:
+            os.mkfifo(path, 0o600)
+        except OSError as exc:
+            if exc.errno != errno.EEXIST:
+                raise
+        return path
+
+    def _wait(self, fifo, condition, timeout):
+        # O_RDWR never blocks on a FIFO and keeps it open for the writers
+        fd = os.open(self._fifo(fifo), os.O_RDWR | os.O_NONBLOCK)
+        try:
+            deadline = time.time() + timeout
+            while not condition():
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    return False
+                readable, _, _ = select.select([fd], [], [], remaining)
+                if readable:
+                    try:
+                        os.read(fd, 512)
+                    except OSError as exc:
+                        if exc.errno != errno.EAGAIN:
+                            raise
+            return True
+        finally:
+            os.close(fd)
+
+    def _notify(self, fifo):
+        try:
+            fd = os.open(self._fifo(fifo), os.O_WRONLY | os.O_NONBLOCK)
+        except OSError as exc:
+            # Nobody is waiting yet, it will find the file by itself
+            if exc.errno == errno.ENXIO:
+                return
+            raise
+        try:
+            os.write(fd, b'.')
+        except OSError as exc:
+            if exc.errno not in (errno.EAGAIN, errno.EPIPE):
+                raise
+        finally:
+            os.close(fd)
+
+    def reset(self):
+        """Remove the fixtures of a previous run"""
+        if os.path.exists(self.fixtures_path):
+            os.remove(self.fixtures_path)
+
+    # Setup side
+
+    def publish(self, fixtures):
+        """Atomically write the fixtures then wake up the run side"""
+        fd, tmp_path = tempfile.mkstemp(dir=self.path, prefix='.fixtures.')
+        with os.fdopen(fd, 'w') as f:
+            json.dump(fixtures, f)
+        os.rename(tmp_path, self.fixtures_path)
+        self._notify(READY)
+
+    def publish_error(self, message):
+        """Publish the error of a failed setup instead of the fixtures"""
+        self.publish({ERROR: message})
+
+    def wait_released(self, timeout):
+        """Wait for the run side to remove the fixtures"""
+        return self._wait(
+            DONE, lambda: not os.path.exists(self.fixtures_path), timeout)
+
+    def close(self):
+        """Remove the fixtures and the FIFOs"""
+        for name in (FIXTURES, READY, DONE):
+            try:
+                os.remove(os.path.join(self.path, name))
+            except OSError:
+                pass
+        try:
+            os.rmdir(self.path)
+        except OSError:
+            pass
+
+    # Run side
+
+    def wait_fixtures(self, timeout):
+        """Wait for the setup side then return its fixtures, or None
+
+        Raise SetupError if the setup side published an error.
+        """
+        if not self._wait(
+                READY, lambda: os.path.exists(self.fixtures_path), timeout):
+            return None
+        with open(self.fixtures_path) as f:
+            fixtures = json.load(f)
+        if ERROR in fixtures:
+            self.release()
+            raise SetupError("Isolation setup failed : %s" % fixtures[ERROR])
+        return fixtures
+
+    def release(self):
+        """Tell the setup side that the tests are over"""
+        self.reset()
+        self._notify(DONE)
+
+# EOF
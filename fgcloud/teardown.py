@@ -0,0 +1,91 @@
+# Copyright 2015 France-Grilles - IDGC - CNRS
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+"""Parallel deletion of test resources
+
+Each resource is deleted as soon as the resources it depends on are gone
+(or failed to go), the independent ones at the same time. The deletion time
+of each resource is sent as perfdata, the failures are logged in one
+summary and counted as leftovers.
+"""
+from oslo_log import log as logging
+from tempest.api.fgcloud import concurrency
+from tempest.api.fgcloud import options  # noqa
+from tempest.api.fgcloud import perfdata
+from tempest import config
+from tempest.lib import exceptions as lib_exc
+
+CONF = config.CONF
+LOG = logging.getLogger(__name__)
+
+
+class Teardown(object):
+    """Dependency-aware teardown
+
+    teardown = Teardown('isolation_cleanup')
+    teardown.add('attachment', detach_volume)
+    teardown.add('volume', delete_volume, requires=['attachment'])
+    teardown.add('server', delete_server, requires=['attachment'])
+    leftovers = teardown.run()
+
+    Requirements that were not added are ignored (the resource was never
+    created). NotFound means the resource is already gone.
+    """
+
+    def __init__(self, prefix='cleanup', max_workers=None):
+        self.prefix = prefix
+        if max_workers is None:
+            max_workers = CONF.fgcloud.max_workers
+        self.graph = concurrency.TaskGraph(max_workers,
+                                           cancel_on_error=False)
+        self.names = []
+
+    def add(self, name, func, requires=()):
+        requires = [r for r in requires if r in self.names]
+        self.graph.add(name, self._wrap(name, func), requires=requires)
+        self.names.append(name)
+
+    def _wrap(self, name, func):
+        def delete():
+            try:
+                func()
+            except lib_exc.NotFound:
+                LOG.info("%s already deleted" % name)
+        return delete
+
+    def run(self):
+        """Delete everything, log a summary and return the leftovers"""
+        self.graph.run(raise_on_error=False)
+
+        summary = []
+        for name in self.names:
+            duration = self.graph.durations.get(name, 0.0)
+            perfdata.add('%s_%s_time' % (self.prefix, name), duration, 's')
+            if name in self.graph.errors:
+                error = self.graph.errors[name][1]
+                summary.append("  %s FAILED after %.1fs : %s" %
+                               (name, duration, error))
+            else:
+                summary.append("  %s deleted in %.1fs" % (name, duration))
+
+        leftovers = list(self.graph.errors)
+        perfdata.add('%s_leftovers' % self.prefix, len(leftovers))
+        if leftovers:
+            LOG.warning("Teardown left %d resource(s) behind :\n%s" %
+                        (len(leftovers), '\n'.join(summary)))
+        else:
+            LOG.info("Teardown done :\n%s" % '\n'.join(summary))
+        return leftovers
+
+# EOF
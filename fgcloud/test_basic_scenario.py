@@ -12,9 +12,15 @@
 #    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
 #    License for the specific language governing permissions and limitations
 #    under the License.
+import re
 from oslo_log import log as logging
+from tempest.api.fgcloud import concurrency
+from tempest.api.fgcloud import instrument
+from tempest.api.fgcloud import options  # noqa
+from tempest.api.fgcloud import perfdata
+from tempest.api.fgcloud import volume_bench
+from tempest.api.fgcloud import waiters as fg_waiters
 from tempest.common import custom_matchers
-from tempest.common import waiters
 from tempest.common.utils import data_utils
 from tempest import config
 from tempest import exceptions
@@ -25,7 +31,7 @@ CONF = config.CONF
 LOG = logging.getLogger(__name__)
 
 
-class TestBasicScenario(manager.ScenarioTest):
+class TestBasicScenario(instrument.InstrumentedTest, manager.ScenarioTest):
 
     """This is a basic scenario test.
 
@@ -47,18 +53,27 @@ class TestBasicScenario(manager.ScenarioTest):
     10. Reboot instance
     11. Check SSH connection to instance after reboot
     12. Read/Compare the timestamp onto the attached volume
+    13. Optionally, benchmark the attached volume (see volume_bench.py)
+
+    Each step is timed and sent as a perfdata value (see perfdata.timer)
+    Steps 2 to 7 can be run in parallel (see provision_concurrently)
 
     """
 
+    def setUp(self):
+        super(TestBasicScenario, self).setUp()
+        # Adaptive polling for the waits of the tempest helpers too
+        self.useFixture(fg_waiters.AdaptiveWaiters())
+
     def _wait_for_server_status(self, server, status):
         server_id = server['id']
         # Raise on error defaults to True, which is consistent with the
         # original function from scenario tests here
-        waiters.wait_for_server_status(self.servers_client,
-                                       server_id, status)
+        fg_waiters.wait_for_server_status(self.servers_client,
+                                          server_id, status)
 
-    def nova_list(self):
-        servers = self.servers_client.list_servers()
+    def nova_list(self, **params):
+        servers = self.servers_client.list_servers(**params)
         # The list servers in the compute client is inconsistent...
         return servers['servers']
 
@@ -75,8 +90,8 @@ class TestBasicScenario(manager.ScenarioTest):
     def cinder_create(self):
         return self.create_volume()
 
-    def cinder_list(self):
-        return self.volumes_client.list_volumes()['volumes']
+    def cinder_list(self, **params):
+        return self.volumes_client.list_volumes(params=params)['volumes']
 
     def cinder_show(self, volume):
         got_volume = self.volumes_client.show_volume(volume['id'])['volume']
@@ -91,107 +106,213 @@ class TestBasicScenario(manager.ScenarioTest):
         partitions = self.linux_client.get_partitions()
         self.assertEqual(1, partitions.count(CONF.compute.volume_device_name))
 
-    def create_and_add_security_group_to_server(self, server):
-        secgroup = self._create_security_group()
-        self.servers_client.add_security_group(server['id'],
-                                               name=secgroup['name'])
-        self.addCleanup(self.servers_client.remove_security_group,
-                        server['id'], name=secgroup['name'])
-
-        def wait_for_secgroup_add():
-            body = (self.servers_client.show_server(server['id'])
-                    ['server'])
-            return {'name': secgroup['name']} in body['security_groups']
-
-        if not test.call_until_true(wait_for_secgroup_add,
-                                    CONF.compute.build_timeout,
-                                    CONF.compute.build_interval):
-            msg = ('Timed out waiting for adding security group %s to server '
-                   '%s' % (secgroup['id'], server['id']))
-            raise exceptions.TimeoutException(msg)
-        return secgroup['name']
+    def create_and_add_security_group_to_server(self, server, secgroup):
+        with perfdata.timer('secgroup_add_time'):
+            self.servers_client.add_security_group(server['id'],
+                                                   name=secgroup['name'])
+            self.addCleanup(self.servers_client.remove_security_group,
+                            server['id'], name=secgroup['name'])
 
-    @test.idempotent_id('53f75314-eed0-4db6-8f43-b21883d3941f')
-    @test.services('compute', 'volume', 'image', 'network')
-    def test_basic_scenario(self):
+            def wait_for_secgroup_add():
+                body = (self.servers_client.show_server(server['id'])
+                        ['server'])
+                return {'name': secgroup['name']} in body['security_groups']
 
-        # Create an image from local files (see conf.scenario.*_img_file)
-        # image = self.glance_image_create()
-        # -or-
-        # Use existing image (faster)
-        image = CONF.compute.image_ref
-        LOG.info('Use existing image ref : %s' % image)
+            if not fg_waiters.call_until_true(wait_for_secgroup_add,
+                                              CONF.compute.build_timeout,
+                                              'secgroup'):
+                msg = ('Timed out waiting for adding security group %s to '
+                       'server %s' % (secgroup['id'], server['id']))
+                raise exceptions.TimeoutException(msg)
+        return secgroup['name']
 
-        # Create keypair for auth
+    def create_keypair_timed(self):
         LOG.info('Creating keypair...')
-        keypair = self.create_keypair()
+        with perfdata.timer('keypair_time'):
+            keypair = self.create_keypair()
         LOG.info('Keypair created : %s (%s)', keypair['name'],
                  keypair['fingerprint'])
+        return keypair
 
-        # Create and boot server
+    def boot_server(self, image, keypair):
         LOG.info('Creating server...')
         name = data_utils.rand_name("TestBasicScenario")
-        server = self.create_server(name=name, image_id=image,
-                                    key_name=keypair['name'],
-                                    wait_until='ACTIVE')
-        servers = self.nova_list()
-        self.assertIn(server['id'], [x['id'] for x in servers])
+        with perfdata.timer('boot_time'):
+            server = self.create_server(name=name, image_id=image,
+                                        key_name=keypair['name'],
+                                        wait_until='ACTIVE')
         LOG.info('Server created : %s', server['name'])
+        return server
+
+    def list_params(self):
+        page_size = CONF.fgcloud.list_page_size
+        return {'limit': page_size} if page_size else {}
+
+    def check_server_listed(self, server):
+        # The name filter is a regex on the Nova side
+        with perfdata.timer('nova_lookup_time'):
+            servers = self.nova_list(name='^%s$' % re.escape(server['name']))
+        self.assertIn(server['id'], [x['id'] for x in servers])
+        with perfdata.timer('nova_list_time'):
+            self.nova_list(**self.list_params())
 
-        # Create a new volume
+    def create_volume_timed(self):
         LOG.info('Creating volume...')
-        volume = self.cinder_create()
-        volumes = self.cinder_list()
-        self.assertIn(volume['id'], [x['id'] for x in volumes])
+        with perfdata.timer('volume_create_time'):
+            volume = self.cinder_create()
         if 'display_name' in volume:
             volume_name = volume['display_name']
         else:
             volume_name = volume['name']
         LOG.info('Volume created : %s', volume_name)
+        return volume
+
+    def check_volume_listed(self, volume):
+        if 'display_name' in volume:
+            params = {'display_name': volume['display_name']}
+        else:
+            params = {'name': volume['name']}
+        with perfdata.timer('cinder_lookup_time'):
+            volumes = self.cinder_list(**params)
+        self.assertIn(volume['id'], [x['id'] for x in volumes])
+        with perfdata.timer('cinder_list_time'):
+            self.cinder_list(**self.list_params())
 
-        # Attach volume to server
+    def attach_volume(self, server, volume):
         LOG.info('Attaching volume to instance...')
-        volume = self.nova_volume_attach(server, volume)
+        with perfdata.timer('attach_time'):
+            volume = self.nova_volume_attach(server, volume)
         self.addCleanup(self.nova_volume_detach, server, volume)
+        return volume
 
-        # Create and associate a floating_ip to the server
+    def create_floating_ip_timed(self, server):
         # We need to specify the pool_name as we may have multiple networks
         LOG.info('Creating Floating IP...')
         fip_net = CONF.network.floating_network_name
-        floating_ip = self.create_floating_ip(server, pool_name=fip_net)
+        with perfdata.timer('fip_time'):
+            floating_ip = self.create_floating_ip(server, pool_name=fip_net)
         LOG.info('Floating IP created : %s (%s)', floating_ip['id'],
                  floating_ip['ip'])
+        return floating_ip
 
+    def create_security_group_timed(self):
         LOG.info('Creating Security Group...')
-        sec_grp_name = self.create_and_add_security_group_to_server(server)
+        with perfdata.timer('secgroup_time'):
+            return self._create_security_group()
+
+    def benchmark_volume(self, dev_name):
+        LOG.info('Benchmarking /dev/%s...' % dev_name)
+        with perfdata.timer('volume_benchmark_time'):
+            results = volume_bench.run(self.linux_client,
+                                       '/dev/%s' % dev_name)
+        for name, mbps, iops, latency in results:
+            LOG.info('Volume %s : %.1f MB/s, %.0f IOPS, %.2f ms' %
+                     (name, mbps, iops, latency))
+            perfdata.add('volume_%s_mbps' % name, float(mbps))
+            perfdata.add('volume_%s_iops' % name, float(iops))
+            perfdata.add('volume_%s_latency' % name, float(latency), 'ms')
+
+    def provision_sequentially(self, image):
+        keypair = self.create_keypair_timed()
+        server = self.boot_server(image, keypair)
+        self.check_server_listed(server)
+
+        volume = self.create_volume_timed()
+        self.check_volume_listed(volume)
+        self.attach_volume(server, volume)
+
+        floating_ip = self.create_floating_ip_timed(server)
+
+        secgroup = self.create_security_group_timed()
+        sec_grp_name = self.create_and_add_security_group_to_server(
+            server, secgroup)
         LOG.info('Security Group created : %s' % sec_grp_name)
+        return keypair, server, floating_ip
+
+    def provision_concurrently(self, image):
+        """Create the independent resources while the server boots
+
+        keypair -> server -> floating IP
+        volume
+        security group
+        Then join them before the attach and the security group add.
+        """
+        graph = concurrency.TaskGraph(CONF.fgcloud.max_workers)
+        graph.add('keypair', self.create_keypair_timed)
+        graph.add('server', lambda: self.boot_server(
+            image, graph.results['keypair']), requires=['keypair'])
+        graph.add('floating_ip', lambda: self.create_floating_ip_timed(
+            graph.results['server']), requires=['server'])
+        graph.add('volume', self.create_volume_timed)
+        graph.add('secgroup', self.create_security_group_timed)
+        resources = graph.run()
+
+        keypair = resources['keypair']
+        server = resources['server']
+        self.check_server_listed(server)
+        self.check_volume_listed(resources['volume'])
+        self.attach_volume(server, resources['volume'])
+        sec_grp_name = self.create_and_add_security_group_to_server(
+            server, resources['secgroup'])
+        LOG.info('Security Group created : %s' % sec_grp_name)
+        return keypair, server, resources['floating_ip']
+
+    @test.idempotent_id('53f75314-eed0-4db6-8f43-b21883d3941f')
+    @test.services('compute', 'volume', 'image', 'network')
+    def test_basic_scenario(self):
+
+        # Create an image from local files (see conf.scenario.*_img_file)
+        # image = self.glance_image_create()
+        # -or-
+        # Use existing image (faster)
+        image = CONF.compute.image_ref
+        LOG.info('Use existing image ref : %s' % image)
+
+        # Create keypair, server, volume, floating IP and security group
+        # See [fgcloud]/concurrent_provisioning in tempest.conf
+        with perfdata.timer('provisioning_time'):
+            if CONF.fgcloud.concurrent_provisioning:
+                keypair, server, floating_ip = self.provision_concurrently(
+                    image)
+            else:
+                keypair, server, floating_ip = self.provision_sequentially(
+                    image)
 
         # check that we can PING and SSH to the server
         LOG.info('Checking connectivity...')
-        ping_result = self.ping_ip_address(ip_address=floating_ip['ip'])
-        self.linux_client = self.get_remote_client(
-            floating_ip['ip'], private_key=keypair['private_key'])
+        with perfdata.timer('ssh_ready_time'):
+            ping_result = self.ping_ip_address(ip_address=floating_ip['ip'])
+            self.linux_client = self.get_remote_client(
+                floating_ip['ip'], private_key=keypair['private_key'])
         LOG.info('Ping to Floating IP : %s' % ping_result)
 
         # Create a timestamp on the volume
         vdev_name = CONF.compute.volume_device_name
-        timestamp = self.create_timestamp(floating_ip['ip'],
-                                          dev_name=vdev_name,
-                                          private_key=keypair['private_key'])
+        with perfdata.timer('timestamp_write_time'):
+            timestamp = self.create_timestamp(
+                floating_ip['ip'], dev_name=vdev_name,
+                private_key=keypair['private_key'])
         LOG.info('Timestamp created on /dev/%s', vdev_name)
 
         # Reboot server
         LOG.info('Server Rebooting...')
-        self.nova_reboot(server)
+        with perfdata.timer('reboot_time'):
+            self.nova_reboot(server)
 
         # check that we can SSH to the server after reboot
-        self.linux_client = self.get_remote_client(
-            floating_ip['ip'], private_key=keypair['private_key'])
+        with perfdata.timer('ssh_reboot_time'):
+            self.linux_client = self.get_remote_client(
+                floating_ip['ip'], private_key=keypair['private_key'])
 
         # Check timestamp on volume after reboot
         LOG.info('Checking timestamp...')
-        timestamp2 = self.get_timestamp(floating_ip['ip'],
-                                        dev_name=vdev_name,
-                                        private_key=keypair['private_key'])
+        with perfdata.timer('timestamp_read_time'):
+            timestamp2 = self.get_timestamp(
+                floating_ip['ip'], dev_name=vdev_name,
+                private_key=keypair['private_key'])
         self.assertEqual(timestamp, timestamp2)
+
+        # Overwrites the filesystem of the timestamp
+        if CONF.fgcloud.volume_benchmark:
+            self.benchmark_volume(vdev_name)
         LOG.info('End of tests, cleaning...')
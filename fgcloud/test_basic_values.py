@@ -14,6 +14,7 @@
 #    under the License.
 
 from oslo_log import log as logging
+from tempest.api.fgcloud import instrument
 from tempest import config
 from tempest.scenario import manager
 from tempest import test
@@ -23,7 +24,7 @@ CONF = config.CONF
 LOG = logging.getLogger(__name__)
 
 
-class TestBasicValues(manager.ScenarioTest):
+class TestBasicValues(instrument.InstrumentedTest, manager.ScenarioTest):
 
     """This is a basic values test.
 
@@ -0,0 +1,159 @@
+# Copyright 2015 France-Grilles - IDGC - CNRS
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+import time
+from oslo_log import log as logging
+from tempest.api.fgcloud import concurrency
+from tempest.api.fgcloud import history
+from tempest.api.fgcloud import instrument
+from tempest.api.fgcloud import options  # noqa
+from tempest.api.fgcloud import perfdata
+from tempest.api.fgcloud import teardown as fg_teardown
+from tempest.api.fgcloud import waiters as fg_waiters
+from tempest.common import compute
+from tempest.common.utils import data_utils
+from tempest import config
+from tempest.scenario import manager
+from tempest import test
+
+CONF = config.CONF
+LOG = logging.getLogger(__name__)
+
+
+class TestBootStorm(instrument.InstrumentedTest, manager.ScenarioTest):
+
+    """Capacity check: boot [fgcloud]/boot_storm_count servers at once.
+
+    Steps:
+    1. Create keypair and security group
+    2. Boot all the servers at the same time, each one in its own thread
+    3. Wait for each server to be ACTIVE
+    4. Optionally add a floating IP to each server and check SSH
+    5. Delete all the servers at the same time (see teardown.py)
+
+    The times are measured from the create request of each server. Their
+    distribution (min, median, p95, max) and the number of failed servers
+    are sent as perfdata (boot_storm_active_*, boot_storm_ssh_*,
+    boot_storm_failures). Meant to be run on a slow schedule, to follow
+    the scheduler and the compute nodes under bursts.
+
+    """
+
+    @classmethod
+    def skip_checks(cls):
+        super(TestBootStorm, cls).skip_checks()
+        if not CONF.fgcloud.boot_storm:
+            raise cls.skipException("Boot storm is not enabled "
+                                    "([fgcloud]/boot_storm)")
+
+    def setUp(self):
+        super(TestBootStorm, self).setUp()
+        self.useFixture(fg_waiters.AdaptiveWaiters())
+
+    def boot_one(self, entry, keypair, secgroup):
+        """Boot a server, filling entry with its ids and timings"""
+        start = time.time()
+        # Not self.create_server: its cleanups delete the servers one by
+        # one, see delete_storm
+        server, _ = compute.create_test_server(
+            self.manager, tenant_network=self.get_tenant_network(),
+            name=data_utils.rand_name('BootStorm'),
+            image_id=CONF.compute.image_ref, key_name=keypair['name'],
+            security_groups=[{'name': secgroup['name']}])
+        entry['server_id'] = server['id']
+        fg_waiters.wait_for_server_status(self.servers_client, server['id'],
+                                          'ACTIVE')
+        entry['active'] = time.time() - start
+        LOG.info('Server %s ACTIVE after %.1fs' % (server['id'],
+                                                   entry['active']))
+        if not CONF.fgcloud.boot_storm_ssh:
+            return
+
+        floating_ip = self.compute_floating_ips_client.create_floating_ip(
+            pool=CONF.network.floating_network_name)['floating_ip']
+        entry['floating_ip_id'] = floating_ip['id']
+        self.compute_floating_ips_client.associate_floating_ip_to_server(
+            floating_ip['ip'], server['id'])
+        self.get_remote_client(floating_ip['ip'],
+                               private_key=keypair['private_key'])
+        entry['ssh'] = time.time() - start
+        LOG.info('Server %s reachable by SSH after %.1fs' % (server['id'],
+                                                             entry['ssh']))
+
+    def delete_storm(self, entries):
+        """Delete the floating IPs and servers, all at the same time"""
+        teardown = fg_teardown.Teardown('boot_storm_cleanup')
+        for index, entry in enumerate(entries):
+            fip_id = entry.get('floating_ip_id')
+            server_id = entry.get('server_id')
+            if fip_id:
+                teardown.add('fip%d' % index,
+                             lambda fip_id=fip_id: self.delete_fip(fip_id))
+            if server_id:
+                teardown.add('server%d' % index,
+                             lambda server_id=server_id:
+                             self.delete_server(server_id),
+                             requires=['fip%d' % index])
+        teardown.run()
+
+    def delete_fip(self, fip_id):
+        self.compute_floating_ips_client.delete_floating_ip(fip_id)
+
+    def delete_server(self, server_id):
+        self.servers_client.delete_server(server_id)
+        fg_waiters.wait_for_resource_deletion(self.servers_client, server_id)
+
+    def report(self, entries, key):
+        times = [entry[key] for entry in entries if key in entry]
+        if not times:
+            return
+        for name, value in (('min', min(times)),
+                            ('median', history.percentile(times, 50)),
+                            ('p95', history.percentile(times, 95)),
+                            ('max', max(times))):
+            perfdata.add('boot_storm_%s_%s' % (key, name), value, 's')
+
+    @test.idempotent_id('5e1a7c93-2f4b-4d86-b0a5-8c6e3f9d2b17')
+    @test.services('compute', 'network')
+    def test_boot_storm(self):
+        count = CONF.fgcloud.boot_storm_count
+        keypair = self.create_keypair()
+        secgroup = self._create_security_group()
+
+        # Filled by the threads, cleaned even after a partial failure
+        entries = [{} for _ in range(count)]
+        self.addCleanup(self.delete_storm, entries)
+
+        LOG.info('Booting %d servers at once...' % count)
+        graph = concurrency.TaskGraph(count, cancel_on_error=False)
+        for index, entry in enumerate(entries):
+            graph.add('server%d' % index,
+                      lambda entry=entry: self.boot_one(entry, keypair,
+                                                        secgroup))
+        with perfdata.timer('boot_storm_time'):
+            graph.run(raise_on_error=False)
+
+        for name, exc_info in graph.errors.items():
+            LOG.warning('Boot storm %s failed : %s' % (name, exc_info[1]))
+        self.report(entries, 'active')
+        self.report(entries, 'ssh')
+        failures = len(graph.errors)
+        perfdata.add('boot_storm_failures', failures)
+        LOG.info('Boot storm : %d/%d servers OK' % (count - failures,
+                                                    count))
+        self.assertLessEqual(
+            failures, CONF.fgcloud.boot_storm_max_failures,
+            '%d/%d servers of the boot storm failed' % (failures, count))
+
+# EOF
@@ -0,0 +1,256 @@
+# Copyright 2015 France-Grilles - IDGC - CNRS
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+import time
+import traceback
+from oslo_log import log as logging
+from tempest.api.fgcloud import canary
+from tempest.api.fgcloud import instrument
+from tempest.api.fgcloud import options  # noqa
+from tempest.api.fgcloud import perfdata
+from tempest.api.fgcloud import waiters as fg_waiters
+from tempest.common import compute
+from tempest.common.utils import data_utils
+from tempest import config
+from tempest.lib import exceptions as lib_exc
+from tempest.scenario import manager
+from tempest import test
+
+CONF = config.CONF
+LOG = logging.getLogger(__name__)
+
+
+class TestCanaryPool(instrument.InstrumentedTest, manager.ScenarioTest):
+
+    """Data plane checks on long-lived canary resources.
+
+    The server, volume, floating IP, keypair and security group are created
+    once, tracked in [fgcloud]/canary_state_file and reused by the next runs
+    as long as they are healthy. test_basic_scenario still checks the full
+    provisioning, on a lower rate.
+
+    Steps:
+    1. Load the canaries of the account from the state file
+    2. Health check: server ACTIVE, volume in-use, floating IP associated
+    3. If needed, delete the remains and create new canaries
+    4. Check SSH connection to the canary
+    5. Write then read a timestamp onto the attached volume
+    6. Optionally reboot and read the timestamp again
+
+    """
+
+    @classmethod
+    def skip_checks(cls):
+        super(TestCanaryPool, cls).skip_checks()
+        if not CONF.fgcloud.canary_pool:
+            raise cls.skipException("Canary pool is not enabled "
+                                    "([fgcloud]/canary_pool)")
+
+    def setUp(self):
+        super(TestCanaryPool, self).setUp()
+        self.useFixture(fg_waiters.AdaptiveWaiters())
+
+        # Only one run at a time may use the canaries
+        self.state = canary.CanaryState(CONF.fgcloud.canary_state_file)
+        lock = self.state.locked()
+        lock.__enter__()
+        self.addCleanup(lock.__exit__, None, None, None)
+
+        creds = self.manager.credentials
+        self.account = '%s/%s' % (creds.tenant_name, creds.username)
+
+    def check_health(self, entry):
+        """Return True if the canaries can be reused"""
+        max_age = CONF.fgcloud.canary_max_age
+        if max_age and time.time() - entry['created_at'] > max_age * 3600:
+            LOG.info("Canaries older than %d hours" % max_age)
+            return False
+        try:
+            server = self.servers_client.show_server(
+                entry['server_id'])['server']
+            if server['status'] != 'ACTIVE':
+                LOG.warning("Canary server is %s" % server['status'])
+                return False
+            volume = self.volumes_client.show_volume(
+                entry['volume_id'])['volume']
+            if volume['status'] != 'in-use':
+                LOG.warning("Canary volume is %s" % volume['status'])
+                return False
+            floating_ip = self.compute_floating_ips_client.show_floating_ip(
+                entry['floating_ip_id'])['floating_ip']
+            if floating_ip['instance_id'] != entry['server_id']:
+                LOG.warning("Canary floating IP is not associated")
+                return False
+        except lib_exc.NotFound:
+            LOG.warning("Canary resource not found:\n%s" %
+                        traceback.format_exc().splitlines()[-1])
+            return False
+        return True
+
+    def delete_canaries(self, entry):
+        """Best effort deletion of the remains of unhealthy canaries"""
+        steps = [
+            (self.compute_floating_ips_client.delete_floating_ip,
+             entry.get('floating_ip_id')),
+            (self.servers_client.delete_server, entry.get('server_id')),
+        ]
+        for delete, resource_id in steps:
+            if resource_id is None:
+                continue
+            try:
+                delete(resource_id)
+            except lib_exc.NotFound:
+                pass
+            except Exception:
+                LOG.warning("Cannot delete canary %s:\n%s" %
+                            (resource_id, traceback.format_exc()))
+
+        if entry.get('server_id'):
+            try:
+                fg_waiters.wait_for_resource_deletion(self.servers_client,
+                                                      entry['server_id'])
+            except Exception:
+                LOG.warning("Canary server %s not deleted" %
+                            entry['server_id'])
+        steps = [
+            (self.volumes_client.delete_volume, entry.get('volume_id')),
+            (self.keypairs_client.delete_keypair, entry.get('keypair_name')),
+            (self.compute_security_groups_client.delete_security_group,
+             entry.get('secgroup_id')),
+        ]
+        for delete, resource_id in steps:
+            if resource_id is None:
+                continue
+            try:
+                delete(resource_id)
+            except lib_exc.NotFound:
+                pass
+            except Exception:
+                LOG.warning("Cannot delete canary %s:\n%s" %
+                            (resource_id, traceback.format_exc()))
+
+    def create_canaries(self):
+        """Create the canaries without cleanup, saving each id on the way"""
+        entry = {'created_at': time.time()}
+
+        keypair = self.keypairs_client.create_keypair(
+            name=data_utils.rand_name('Canary'))['keypair']
+        entry['keypair_name'] = keypair['name']
+        entry['private_key'] = keypair['private_key']
+        self.state.set(self.account, entry)
+
+        secgroup = self.compute_security_groups_client.create_security_group(
+            name=data_utils.rand_name('Canary'),
+            description='fgcloud canary')['security_group']
+        entry['secgroup_id'] = secgroup['id']
+        self.state.set(self.account, entry)
+        rules_client = self.compute_security_group_rules_client
+        for protocol, from_port, to_port in (('tcp', 22, 22),
+                                             ('icmp', -1, -1)):
+            rules_client.create_security_group_rule(
+                parent_group_id=secgroup['id'], ip_protocol=protocol,
+                from_port=from_port, to_port=to_port, cidr='0.0.0.0/0')
+
+        server, _ = compute.create_test_server(
+            self.manager, tenant_network=self.get_tenant_network(),
+            name=data_utils.rand_name('Canary'),
+            image_id=CONF.compute.image_ref,
+            key_name=keypair['name'],
+            security_groups=[{'name': secgroup['name']}])
+        entry['server_id'] = server['id']
+        self.state.set(self.account, entry)
+
+        volume = self.volumes_client.create_volume(
+            size=CONF.volume.volume_size,
+            display_name=data_utils.rand_name('Canary'))['volume']
+        entry['volume_id'] = volume['id']
+        self.state.set(self.account, entry)
+
+        fg_waiters.wait_for_server_status(self.servers_client, server['id'],
+                                          'ACTIVE')
+        fg_waiters.wait_for_volume_status(self.volumes_client, volume['id'],
+                                          'available')
+        self.servers_client.attach_volume(server['id'],
+                                          volumeId=volume['id'])
+        fg_waiters.wait_for_volume_status(self.volumes_client, volume['id'],
+                                          'in-use')
+
+        floating_ip = self.compute_floating_ips_client.create_floating_ip(
+            pool=CONF.network.floating_network_name)['floating_ip']
+        entry['floating_ip_id'] = floating_ip['id']
+        entry['ip'] = floating_ip['ip']
+        self.state.set(self.account, entry)
+        self.compute_floating_ips_client.associate_floating_ip_to_server(
+            floating_ip['ip'], server['id'])
+        return entry
+
+    @test.idempotent_id('9b2d8f35-3c0e-4f57-a0c8-7e3d6a1f42c9')
+    @test.services('compute', 'volume', 'network')
+    def test_canary_data_plane(self):
+        entry = self.state.get(self.account)
+        with perfdata.timer('canary_health_time'):
+            healthy = entry is not None and self.check_health(entry)
+
+        if healthy:
+            LOG.info('Reusing canaries of %s' % self.account)
+            perfdata.add('canary_reused', 1)
+        else:
+            perfdata.add('canary_reused', 0)
+            if entry is not None:
+                LOG.info('Deleting unhealthy canaries of %s' % self.account)
+                self.delete_canaries(entry)
+                self.state.set(self.account, None)
+            LOG.info('Creating canaries for %s' % self.account)
+            with perfdata.timer('canary_provision_time'):
+                try:
+                    entry = self.create_canaries()
+                except Exception:
+                    # Do not leave half created canaries
+                    self.delete_canaries(self.state.get(self.account) or {})
+                    self.state.set(self.account, None)
+                    raise
+            self.state.set(self.account, entry)
+
+        ip = entry['ip']
+        private_key = entry['private_key']
+        vdev_name = CONF.compute.volume_device_name
+
+        with perfdata.timer('canary_ssh_time'):
+            self.ping_ip_address(ip_address=ip)
+            self.linux_client = self.get_remote_client(
+                ip, private_key=private_key)
+
+        with perfdata.timer('canary_volume_write_time'):
+            timestamp = self.create_timestamp(ip, dev_name=vdev_name,
+                                              private_key=private_key)
+        with perfdata.timer('canary_volume_read_time'):
+            timestamp2 = self.get_timestamp(ip, dev_name=vdev_name,
+                                            private_key=private_key)
+        self.assertEqual(timestamp, timestamp2)
+
+        if CONF.fgcloud.canary_reboot:
+            with perfdata.timer('canary_reboot_time'):
+                self.servers_client.reboot_server(entry['server_id'],
+                                                  type='SOFT')
+                fg_waiters.wait_for_server_status(self.servers_client,
+                                                  entry['server_id'],
+                                                  'ACTIVE')
+            with perfdata.timer('canary_ssh_reboot_time'):
+                self.linux_client = self.get_remote_client(
+                    ip, private_key=private_key)
+            timestamp3 = self.get_timestamp(ip, dev_name=vdev_name,
+                                            private_key=private_key)
+            self.assertEqual(timestamp, timestamp3)
+
+# EOF
@@ -0,0 +1,135 @@
+# Copyright 2015 France-Grilles - IDGC - CNRS
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+from oslo_log import log as logging
+from tempest.api.fgcloud import concurrency
+from tempest.api.fgcloud import instrument
+from tempest.api.fgcloud import net_probe
+from tempest.api.fgcloud import options  # noqa
+from tempest.api.fgcloud import perfdata
+from tempest.api.fgcloud import waiters as fg_waiters
+from tempest.common.utils import data_utils
+from tempest import config
+from tempest.scenario import manager
+from tempest import test
+
+CONF = config.CONF
+LOG = logging.getLogger(__name__)
+
+
+class TestNetworkProbe(instrument.InstrumentedTest, manager.ScenarioTest):
+
+    """East-west network latency and throughput between two servers.
+
+    Steps:
+    1. Create keypair and security group (SSH, ICMP, probe TCP port)
+    2. Boot 2 servers on the tenant network, with a floating IP each
+    3. Check SSH connection to both servers
+    4. Ping the second server from the first one, over the private
+       network then over the floating IP
+    5. Send TCP traffic from the first server to the second one, over the
+       private network then over the floating IP
+
+    The RTT distribution (min, median, p95, max), the packet loss and the
+    throughput of each path are sent as perfdata (net_private_*,
+    net_floating_*), see net_probe.py.
+
+    """
+
+    @classmethod
+    def skip_checks(cls):
+        super(TestNetworkProbe, cls).skip_checks()
+        if not CONF.fgcloud.network_probe:
+            raise cls.skipException("Network probe is not enabled "
+                                    "([fgcloud]/network_probe)")
+
+    def setUp(self):
+        super(TestNetworkProbe, self).setUp()
+        self.useFixture(fg_waiters.AdaptiveWaiters())
+
+    def create_security_group_probe(self):
+        secgroup = self._create_security_group()
+        port = CONF.fgcloud.network_probe_port
+        self.compute_security_group_rules_client.create_security_group_rule(
+            parent_group_id=secgroup['id'], ip_protocol='tcp',
+            from_port=port, to_port=port, cidr='0.0.0.0/0')
+        return secgroup
+
+    def boot_probe_server(self, keypair, secgroup):
+        server = self.create_server(
+            name=data_utils.rand_name('NetworkProbe'),
+            image_id=CONF.compute.image_ref, key_name=keypair['name'],
+            security_groups=[{'name': secgroup['name']}],
+            wait_until='ACTIVE')
+        floating_ip = self.create_floating_ip(
+            server, pool_name=CONF.network.floating_network_name)
+        return server, floating_ip
+
+    def get_fixed_ip(self, server):
+        server = self.servers_client.show_server(server['id'])['server']
+        for addresses in server['addresses'].values():
+            for address in addresses:
+                if (address.get('OS-EXT-IPS:type', 'fixed') == 'fixed' and
+                        address.get('version', 4) == 4):
+                    return address['addr']
+        self.fail('No fixed IPv4 address for server %s' % server['id'])
+
+    def measure_rtt(self, client, path, ip):
+        LOG.info('Pinging %s (%s)...' % (ip, path))
+        rtts, loss = net_probe.parse_ping(
+            client.exec_command(net_probe.ping_command(ip)))
+        perfdata.add('net_%s_loss' % path, loss, '%')
+        self.assertTrue(rtts, 'No ping reply from %s (%s)' % (ip, path))
+        for name, value in net_probe.rtt_stats(rtts):
+            perfdata.add('net_%s_rtt_%s' % (path, name), '%.3f' % value,
+                         'ms')
+
+    def measure_throughput(self, sender, receiver, path, ip):
+        LOG.info('Sending TCP traffic to %s (%s)...' % (ip, path))
+        receiver.exec_command(net_probe.receiver_command())
+        mbps = net_probe.parse_sender(
+            sender.exec_command(net_probe.sender_command(ip)))
+        self.assertIsNotNone(mbps, 'No TCP traffic to %s:%d (%s)' % (
+            ip, CONF.fgcloud.network_probe_port, path))
+        LOG.info('Throughput %s : %.1f MB/s' % (path, mbps))
+        perfdata.add('net_%s_mbps' % path, float(mbps))
+
+    @test.idempotent_id('0c6f4d3e-5b8a-4f21-9e57-2d7b1a8c3f60')
+    @test.services('compute', 'network')
+    def test_network_probe(self):
+        with perfdata.timer('net_provisioning_time'):
+            keypair = self.create_keypair()
+            secgroup = self.create_security_group_probe()
+            graph = concurrency.TaskGraph(2)
+            for name in ('sender', 'receiver'):
+                graph.add(name, lambda: self.boot_probe_server(keypair,
+                                                               secgroup))
+            servers = graph.run()
+        sender, sender_fip = servers['sender']
+        receiver, receiver_fip = servers['receiver']
+        receiver_ip = self.get_fixed_ip(receiver)
+
+        with perfdata.timer('net_ssh_ready_time'):
+            sender_client = self.get_remote_client(
+                sender_fip['ip'], private_key=keypair['private_key'])
+            receiver_client = self.get_remote_client(
+                receiver_fip['ip'], private_key=keypair['private_key'])
+
+        for path, ip in (('private', receiver_ip),
+                         ('floating', receiver_fip['ip'])):
+            self.measure_rtt(sender_client, path, ip)
+            self.measure_throughput(sender_client, receiver_client, path, ip)
+
+# EOF
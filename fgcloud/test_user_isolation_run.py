@@ -13,12 +13,17 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
-import json
-import os.path
+import sys
 import testtools
 import time
+import unittest
 from oslo_log import log as logging
 from tempest.api.compute import base
+from tempest.api.fgcloud import concurrency
+from tempest.api.fgcloud import instrument
+from tempest.api.fgcloud import options  # noqa
+from tempest.api.fgcloud import rendezvous
+from tempest.api.fgcloud import waiters
 from tempest import config
 from tempest.common.utils import data_utils
 from tempest.lib import exceptions as lib_exc
@@ -26,10 +31,77 @@ from tempest import test
 
 CONF = config.CONF
 LOG = logging.getLogger(__name__)
-file_path = "/tmp/tempest_" + CONF.compute.image_ref
 
+channel_path = "/tmp/tempest_" + CONF.compute.image_ref + ".d"
 
-class UserIsolationRun(base.BaseV2ComputeTest):
+
+def load_tests(loader, tests, pattern):
+    """See [fgcloud]/concurrent_isolation_checks"""
+    if not CONF.fgcloud.concurrent_isolation_checks:
+        return tests
+    return ConcurrentChecks(testtools.iterate_tests(tests))
+
+
+class _Sequence(object):
+
+    def __init__(self, tests):
+        self.tests = tests
+
+    def run(self, result):
+        for test in self.tests:
+            test.run(result)
+
+
+class ConcurrentChecks(unittest.TestSuite):
+    """Run the selected UserIsolationRun checks at the same time
+
+    The checks only make one API call each on the fixtures, so they do
+    not depend on each other. The class fixtures are set up once, then
+    each test runs with its own setUp and cleanups in one of
+    [fgcloud]/max_workers threads and is still reported on its own.
+    """
+
+    def run(self, result):
+        # Only the tests left by the selection (ie. testr --load-list)
+        tests = list(testtools.iterate_tests(self))
+        if not tests:
+            return result
+        cls = type(tests[0])
+        class_id = '%s.%s' % (cls.__module__, cls.__name__)
+        try:
+            cls.setUpClass()
+        except unittest.SkipTest as exc:
+            for test in tests:
+                result.startTest(test)
+                result.addSkip(test, str(exc))
+                result.stopTest(test)
+            return result
+        except Exception:
+            testtools.ErrorHolder('setUpClass (%s)' % class_id,
+                                  sys.exc_info()).run(result)
+            return result
+
+        workers = max(1, CONF.fgcloud.max_workers)
+
+        def split(suite):
+            return [_Sequence(tests[i::workers])
+                    for i in range(min(workers, len(tests)))]
+
+        start = time.time()
+        try:
+            testtools.ConcurrentTestSuite(self, split).run(result)
+            LOG.info("%d checks done in %.1fs" %
+                     (len(tests), time.time() - start))
+        finally:
+            try:
+                cls.tearDownClass()
+            except Exception:
+                testtools.ErrorHolder('tearDownClass (%s)' % class_id,
+                                      sys.exc_info()).run(result)
+        return result
+
+
+class UserIsolationRun(instrument.InstrumentedTest, base.BaseV2ComputeTest):
 
     credentials = ['primary']
 
@@ -66,19 +138,17 @@ class UserIsolationRun(base.BaseV2ComputeTest):
     def resource_setup(cls):
         super(UserIsolationRun, cls).resource_setup()
 
-        LOG.info("Starting VM_Run")
-        name = data_utils.rand_name('VM_Run')
-        server = cls.create_test_server(name=name, wait_until='ACTIVE')
-        cls.server_run = cls.client.show_server(server['id'])['server']
-        LOG.info("VM_Run started and active ")
+        # VM_Run boots while the setup side creates the fixtures
+        if CONF.fgcloud.isolation_run_server:
+            cls.boot_run = concurrency.BackgroundTask(cls._boot_server_run)
 
         LOG.info("Waiting for VM_Setup to get ready...")
-        while not os.path.exists(file_path):
-            time.sleep(3)
-
-        f = open(file_path)
-        fileinfo = json.load(f)
-        f.close()
+        cls.channel = rendezvous.Channel(channel_path)
+        timeout = CONF.fgcloud.isolation_timeout
+        fileinfo = cls.channel.wait_fixtures(timeout)
+        if fileinfo is None:
+            raise lib_exc.TimeoutException(
+                "Isolation setup not ready within %d s" % timeout)
 
         cls.server = fileinfo['server']
         if not CONF.compute_feature_enabled.snapshot:
@@ -99,11 +169,35 @@ class UserIsolationRun(base.BaseV2ComputeTest):
 
         LOG.info("Running isolation tests from user B...")
 
+    @classmethod
+    def _boot_server_run(cls):
+        LOG.info("Starting VM_Run")
+        name = data_utils.rand_name('VM_Run')
+        server = cls.create_test_server(name=name)
+        waiters.wait_for_server_status(cls.client, server['id'], 'ACTIVE')
+        server_run = cls.client.show_server(server['id'])['server']
+        LOG.info("VM_Run started and active ")
+        return server_run
+
+    def get_server_run(self):
+        """Wait for VM_Run, only when a check needs it"""
+        if not hasattr(self, 'boot_run'):
+            raise self.skipException("VM_Run is not enabled "
+                                     "([fgcloud]/isolation_run_server)")
+        return self.boot_run.join()
+
     @classmethod
     def resource_cleanup(cls):
-        if hasattr(cls, 'server'):
-            cls.client.delete_server(cls.server_run['id'])
-        os.remove(file_path)
+        if hasattr(cls, 'boot_run'):
+            try:
+                server_run = cls.boot_run.join()
+                cls.client.delete_server(server_run['id'])
+            except Exception:
+                # A server created before the failure is deleted by the
+                # base class with the other servers
+                LOG.warning("Cannot cleanup VM_Run", exc_info=True)
+        if hasattr(cls, 'channel'):
+            cls.channel.release()
         super(UserIsolationRun, cls).resource_cleanup()
 
 # General
@@ -488,7 +582,7 @@ class UserIsolationRun(base.BaseV2ComputeTest):
     @test.idempotent_id('1c48d877-6f4b-480e-ab18-5fe26418bc0a')
     def test_attach_volume_of_alt_account_fails(self):
         try:
-            self.client.attach_volume(self.server_run['id'],
+            self.client.attach_volume(self.get_server_run()['id'],
                                       volumeId=self.volume1['id'])
         except lib_exc.NotFound:
             pass
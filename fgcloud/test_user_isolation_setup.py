@@ -12,13 +12,16 @@
 #    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
 #    License for the specific language governing permissions and limitations
 #    under the License.
-import json
-import os.path
-import time
-import traceback
+import six
+import sys
 from oslo_log import log as logging
 from tempest.api.compute import base
-from tempest.common import waiters
+from tempest.api.fgcloud import concurrency
+from tempest.api.fgcloud import instrument
+from tempest.api.fgcloud import options  # noqa
+from tempest.api.fgcloud import rendezvous
+from tempest.api.fgcloud import teardown as fg_teardown
+from tempest.api.fgcloud import waiters
 from tempest.common.utils import data_utils
 from tempest.lib import exceptions as lib_exc
 from tempest import config
@@ -26,10 +29,11 @@ from tempest import test
 
 CONF = config.CONF
 LOG = logging.getLogger(__name__)
-file_path = "/tmp/tempest_" + CONF.compute.image_ref
 
+channel_path = "/tmp/tempest_" + CONF.compute.image_ref + ".d"
 
-class UserIsolationSetup(base.BaseV2ComputeTest):
+
+class UserIsolationSetup(instrument.InstrumentedTest, base.BaseV2ComputeTest):
 
     credentials = ['primary']
 
@@ -66,211 +70,221 @@ class UserIsolationSetup(base.BaseV2ComputeTest):
     def resource_setup(cls):
         super(UserIsolationSetup, cls).resource_setup()
 
+        cls.channel = rendezvous.Channel(channel_path)
+        cls.channel.reset()
+
+        # Independent branches are created in parallel, the attachment
+        # waits for the server snapshot as Nova refuses to attach a volume
+        # to a server being snapshotted
+        graph = concurrency.TaskGraph(CONF.fgcloud.max_workers)
+        graph.add('server', cls._create_server)
+        attach_requires = ['server', 'volume2']
+        if not CONF.compute_feature_enabled.snapshot:
+            LOG.info("Snapshot skipped as instance/image snapshotting is not enabled")
+        else:
+            graph.add('server_snapshot', cls._create_server_snapshot,
+                      requires=['server'])
+            attach_requires.append('server_snapshot')
+        graph.add('keypairname', cls._create_keypair)
+        graph.add('security_group', cls._create_security_group)
+        graph.add('rule', cls._create_security_group_rule,
+                  requires=['security_group'])
+        graph.add('volume1', cls._create_volume1)
+        graph.add('volume2', cls._create_volume2)
+        if not CONF.volume_feature_enabled.snapshot:
+            LOG.info("Snapshot skipped as volume snapshotting is not enabled")
+        else:
+            graph.add('vol_snapshot', cls._create_volume_snapshot,
+                      requires=['volume1'])
+        graph.add('attachment', cls._attach_volume, requires=attach_requires)
+        try:
+            graph.run()
+        except Exception as exc:
+            exc_info = sys.exc_info()
+            # Fail the run side at once, then let it read the error before
+            # the cleanup removes the channel
+            cls.channel.publish_error("%s: %s" % (type(exc).__name__, exc))
+            cls.channel.wait_released(CONF.fgcloud.isolation_timeout)
+            six.reraise(*exc_info)
+        finally:
+            for name, duration in sorted(graph.durations.items()):
+                LOG.info("%s done in %.1fs" % (name, duration))
+
         # Prepare an array to store information
-        fileinfo = {}
-        if os.path.exists(file_path):
-            LOG.info("/!\\ deleting previous file /!\\")
-            os.remove(file_path)
+        fileinfo = dict(graph.results)
+        fileinfo['metadata'] = cls.metadata
+
+        # Hand the information over to the run side
+        cls.channel.publish(fileinfo)
+        LOG.info("Fixtures published in %s, waiting..." % cls.channel.path)
 
-        # Create a server
+    @classmethod
+    def _create_server(cls):
         LOG.info("Starting VM_Setup")
         name = data_utils.rand_name('VM_Setup')
-        server = cls.create_test_server(name=name, wait_until='ACTIVE')
+        server = cls.create_test_server(name=name)
+        waiters.wait_for_server_status(cls.client, server['id'], 'ACTIVE')
         cls.server = cls.client.show_server(server['id'])['server']
-        fileinfo['server'] = cls.server
         LOG.info("VM_Setup created and active (%s)" % server['id'])
+        return cls.server
 
-        # Create a server snapshot
-        if not CONF.compute_feature_enabled.snapshot:
-            LOG.info("Snapshot skipped as instance/image snapshotting is not enabled")
-        else:
-            name = data_utils.rand_name('snapshot')
-            body = cls.compute_images_client.create_image(cls.server['id'],
-                                                          name=name)
-            snap_id = data_utils.parse_image_id(body.response['location'])
-            waiters.wait_for_image_status(cls.compute_images_client,
-                                          snap_id, 'ACTIVE')
-            cls.snap = cls.compute_images_client.show_image(snap_id)['image']
-            fileinfo['server_snapshot'] = cls.snap
-            LOG.info("Server Snapshot created and active (%s)" % snap_id)
+    @classmethod
+    def _create_server_snapshot(cls):
+        name = data_utils.rand_name('snapshot')
+        body = cls.compute_images_client.create_image(cls.server['id'],
+                                                      name=name)
+        snap_id = data_utils.parse_image_id(body.response['location'])
+        waiters.wait_for_image_status(cls.compute_images_client,
+                                      snap_id, 'ACTIVE')
+        cls.snap = cls.compute_images_client.show_image(snap_id)['image']
+        LOG.info("Server Snapshot created and active (%s)" % snap_id)
+        return cls.snap
 
-        # Create a keypair
-        cls.keypairname = data_utils.rand_name('keypair')
-        cls.keypairs_client.create_keypair(name=cls.keypairname)
-        fileinfo['keypairname'] = cls.keypairname
-        LOG.info("Keypair created (%s)" % cls.keypairname)
+    @classmethod
+    def _create_keypair(cls):
+        keypairname = data_utils.rand_name('keypair')
+        cls.keypairs_client.create_keypair(name=keypairname)
+        cls.keypairname = keypairname
+        LOG.info("Keypair created (%s)" % keypairname)
+        return keypairname
 
-        # Create a security group
+    @classmethod
+    def _create_security_group(cls):
         name = data_utils.rand_name('security')
         description = data_utils.rand_name('description')
         cls.security_group = cls.security_client.create_security_group(
             name=name, description=description)['security_group']
-        fileinfo['security_group'] = cls.security_group
         LOG.info("Security group created (%s)" % name)
+        return cls.security_group
 
-        # Create a security group rule
+    @classmethod
+    def _create_security_group_rule(cls):
         cls.rule = cls.rule_client.create_security_group_rule(
             parent_group_id=cls.security_group['id'], ip_protocol='tcp',
             from_port=22, to_port=22)['security_group_rule']
-        fileinfo['rule'] = cls.rule
         LOG.info("Security rule created (%s)" % cls.rule['id'])
+        return cls.rule
 
-        # Create two volumes
+    @classmethod
+    def _create_volume1(cls):
         name = data_utils.rand_name('volume1')
         cls.metadata = {'vol_metadata': data_utils.rand_name('vol_metadata')}
         cls.volume1 = cls.volumes_client.create_volume(
             size=1, display_name=name, metadata=cls.metadata)['volume']
+        waiters.wait_for_volume_status(cls.volumes_client,
+                                       cls.volume1['id'], 'available')
+        LOG.info("Volume 1 created (%s)" % cls.volume1['id'])
+        return cls.volume1
+
+    @classmethod
+    def _create_volume2(cls):
         name = data_utils.rand_name('volume2')
         cls.volume2 = cls.volumes_client.create_volume(
             size=1, display_name=name)['volume']
-        waiters.wait_for_volume_status(cls.volumes_client,
-                                       cls.volume1['id'], 'available')
         waiters.wait_for_volume_status(cls.volumes_client,
                                        cls.volume2['id'], 'available')
-        fileinfo['volume1'] = cls.volume1
-        fileinfo['metadata'] = cls.metadata
-        fileinfo['volume2'] = cls.volume2
-        LOG.info("Volumes created (1:%s / 2:%s)" %
-                 (cls.volume1['id'], cls.volume2['id']))
+        LOG.info("Volume 2 created (%s)" % cls.volume2['id'])
+        return cls.volume2
 
-        # Create a snapshot from volume1
-        if not CONF.volume_feature_enabled.snapshot:
-            LOG.info("Snapshot skipped as volume snapshotting is not enabled")
-        else:
-            name = data_utils.rand_name('vol_snapshot')
-            cls.vol_snapshot = cls.snapshots_client.create_snapshot(
-                volume_id=cls.volume1['id'],
-                display_name=name)['snapshot']
-            waiters.wait_for_snapshot_status(cls.snapshots_client,
-                                             cls.vol_snapshot['id'],
-                                             'available')
-            fileinfo['vol_snapshot'] = cls.vol_snapshot
-            LOG.info("Volume 1 snapshot created (%s)" % cls.vol_snapshot['id'])
+    @classmethod
+    def _create_volume_snapshot(cls):
+        name = data_utils.rand_name('vol_snapshot')
+        cls.vol_snapshot = cls.snapshots_client.create_snapshot(
+            volume_id=cls.volume1['id'],
+            display_name=name)['snapshot']
+        waiters.wait_for_snapshot_status(cls.snapshots_client,
+                                         cls.vol_snapshot['id'],
+                                         'available')
+        LOG.info("Volume 1 snapshot created (%s)" % cls.vol_snapshot['id'])
+        return cls.vol_snapshot
 
-        # Attach volume2 to the server
+    @classmethod
+    def _attach_volume(cls):
         cls.attachment = cls.servers_client.attach_volume(
             cls.server['id'],
             volumeId=cls.volume2['id'])['volumeAttachment']
         waiters.wait_for_volume_status(cls.volumes_client,
                                        cls.volume2['id'], 'in-use')
-        fileinfo['attachment'] = cls.attachment
         LOG.info("Volume 2 attached to server")
-
-        # Save array information to file
-        f = open(file_path, 'w')
-        json.dump(fileinfo, f)
-        f.close()
-        LOG.info("File created with ids, waiting...")
+        return cls.attachment
 
     @classmethod
-    def resource_cleanup(cls):
-
+    def _detach_volume(cls):
         try:
-            if hasattr(cls, 'attachment'):
-                cls.client.detach_volume(cls.server['id'], cls.volume2['id'])
-                waiters.wait_for_volume_status(cls.volumes_client,
-                                               cls.volume2['id'], 'available')
-        except lib_exc.NotFound:
-            # The server may be already deleted so does the attachment...
-            pass
+            cls.client.detach_volume(cls.server['id'], cls.volume2['id'])
         except lib_exc.Conflict:
-            # Raised when instance is in ERROR state
-            cls.client.delete_server(cls.server['id'])
-        except:
-            exc_info = traceback.format_exc().splitlines()
-            LOG.warning("Cannot cleanup attachment\n%s\n%s" %
-                      (exc_info[-1], exc_info[-2]))
+            # Raised when instance is in ERROR state, deleting the server
+            # will release the volume
+            LOG.warning("Cannot detach volume2 from VM_Setup")
+            return
+        waiters.wait_for_volume_status(cls.volumes_client,
+                                       cls.volume2['id'], 'available')
 
+    @classmethod
+    def _delete_volume_snapshot(cls):
+        waiters.wait_for_volume_status(cls.volumes_client,
+                                       cls.volume1['id'], 'available')
         try:
-            if hasattr(cls, 'vol_snapshot'):
-                waiters.wait_for_volume_status(cls.volumes_client,
-                                               cls.volume1['id'], 'available')
-                cls.snapshots_client.delete_snapshot(cls.vol_snapshot['id'])
-                cls.snapshots_client.wait_for_resource_deletion(
-                                                        cls.vol_snapshot['id'])
-        except (lib_exc.BadRequest, lib_exc.NotFound):
+            cls.snapshots_client.delete_snapshot(cls.vol_snapshot['id'])
+        except lib_exc.BadRequest:
             pass
-        except:
-            exc_info = traceback.format_exc().splitlines()
-            LOG.warning("Cannot cleanup snapshot\n%s\n%s" %
-                      (exc_info[-1], exc_info[-2]))
-        try:
-            if hasattr(cls, 'volume1'):
-                if hasattr(cls, 'vol_snapshot'):
-                    cls.snapshots_client.wait_for_resource_deletion(
-                                                        cls.vol_snapshot['id'])
-                cls.volumes_client.delete_volume(cls.volume1['id'])
-                cls.volumes_client.wait_for_resource_deletion(
-                                                        cls.volume1['id'])
-        except:
-            exc_info = traceback.format_exc().splitlines()
-            LOG.warning("Cannot cleanup volume1\n%s\n%s" %
-                      (exc_info[-1], exc_info[-2]))
-
-        try:
-            if hasattr(cls, 'volume2'):
-                waiters.wait_for_volume_status(cls.volumes_client,
-                                               cls.volume2['id'], 'available')
-                cls.volumes_client.delete_volume(cls.volume2['id'])
-                cls.volumes_client.wait_for_resource_deletion(
-                                                            cls.volume2['id'])
-        except:
-            exc_info = traceback.format_exc().splitlines()
-            LOG.warning("Cannot cleanup volume2\n%s\n%s" %
-                      (exc_info[-1], exc_info[-2]))
+        waiters.wait_for_resource_deletion(cls.snapshots_client,
+                                           cls.vol_snapshot['id'])
 
-        try:
-            if hasattr(cls, 'snap'):
-                cls.image_client.delete_image(cls.snap['id'])
-        except:
-            exc_info = traceback.format_exc().splitlines()
-            LOG.warning("Cannot cleanup server snapshot\n%s\n%s" %
-                      (exc_info[-1], exc_info[-2]))
-
-        try:
-            if hasattr(cls, 'keypairname'):
-                cls.keypairs_client.delete_keypair(cls.keypairname)
-        except:
-            exc_info = traceback.format_exc().splitlines()
-            LOG.warning("Cannot cleanup keypairname\n%s\n%s" %
-                      (exc_info[-1], exc_info[-2]))
-
-        try:
-            if hasattr(cls, 'security_group'):
-                cls.security_client.delete_security_group(
-                                                     cls.security_group['id'])
-        except:
-            exc_info = traceback.format_exc().splitlines()
-            LOG.warning("Cannot cleanup security_group\n%s\n%s" %
-                      (exc_info[-1], exc_info[-2]))
+    @classmethod
+    def _delete_volume(cls, volume):
+        waiters.wait_for_volume_status(cls.volumes_client,
+                                       volume['id'], 'available')
+        cls.volumes_client.delete_volume(volume['id'])
+        waiters.wait_for_resource_deletion(cls.volumes_client, volume['id'])
 
-        try:
-            if hasattr(cls, 'server'):
-                cls.client.delete_server(cls.server['id'])
-        except lib_exc.NotFound:
-            pass
-        except:
-            exc_info = traceback.format_exc().splitlines()
-            LOG.warning("Cannot cleanup server\n%s\n%s" %
-                      (exc_info[-1], exc_info[-2]))
+    @classmethod
+    def _delete_server(cls):
+        cls.client.delete_server(cls.server['id'])
+        waiters.wait_for_resource_deletion(cls.client, cls.server['id'])
 
-        try:
-            if os.path.exists(file_path):
-                os.remove(file_path)
-        except:
-            exc_info = traceback.format_exc().splitlines()
-            LOG.warning("Cannot cleanup file\n%s\n%s" %
-                      (exc_info[-1], exc_info[-2]))
+    @classmethod
+    def resource_cleanup(cls):
+        # A volume goes after its snapshot and its attachment, the server
+        # after the attachment, everything else at the same time
+        teardown = fg_teardown.Teardown('isolation_cleanup')
+        if hasattr(cls, 'attachment'):
+            teardown.add('attachment', cls._detach_volume)
+        if hasattr(cls, 'vol_snapshot'):
+            teardown.add('vol_snapshot', cls._delete_volume_snapshot)
+        if hasattr(cls, 'volume1'):
+            teardown.add('volume1',
+                         lambda: cls._delete_volume(cls.volume1),
+                         requires=['vol_snapshot'])
+        if hasattr(cls, 'volume2'):
+            teardown.add('volume2',
+                         lambda: cls._delete_volume(cls.volume2),
+                         requires=['attachment'])
+        if hasattr(cls, 'snap'):
+            teardown.add('server_snapshot',
+                         lambda: cls.image_client.delete_image(
+                             cls.snap['id']))
+        if hasattr(cls, 'keypairname'):
+            teardown.add('keypair',
+                         lambda: cls.keypairs_client.delete_keypair(
+                             cls.keypairname))
+        if hasattr(cls, 'security_group'):
+            teardown.add('security_group',
+                         lambda: cls.security_client.delete_security_group(
+                             cls.security_group['id']))
+        if hasattr(cls, 'server'):
+            teardown.add('server', cls._delete_server,
+                         requires=['attachment'])
+        teardown.run()
 
-        try:
-            os.remove(file_path)
-        except:
-            pass
+        if hasattr(cls, 'channel'):
+            cls.channel.close()
         super(UserIsolationSetup, cls).resource_cleanup()
 
     @test.idempotent_id('30d8f7d5-84cc-47e1-9ccd-e694ab86b685')
     def test_wait_for_tests_to_terminate(self):
-        while os.path.exists(file_path):
-            time.sleep(3)
+        timeout = CONF.fgcloud.isolation_timeout
+        if not self.channel.wait_released(timeout):
+            self.fail("Isolation tests not terminated within %d s" % timeout)
 
 # EOF
@@ -0,0 +1,97 @@
+# Copyright 2015 France-Grilles - IDGC - CNRS
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+"""Warning and critical limits per scenario phase and per test
+
+One limit per line (see config/thresholds.txt.sample) :
+  phase  <perfdata label regex>  <warning>  <critical>
+  test   <test id regex>         <warning>  <critical>
+
+The first matching line applies, '-' means no limit. A phase is a value
+sent by the tests (ie. boot_time, see fgcloud/perfdata.py) or exec_time, a
+test limit applies to the duration of each matching test.
+
+A limit is a maximum, or a minimum when followed by ':' like the Nagios
+ranges (ie. '50:' for the throughputs, alert below 50).
+"""
+import re
+
+KINDS = ('phase', 'test')
+
+
+def _limit(value):
+    """Return (value, is_minimum) or None"""
+    if value == '-':
+        return None
+    if value.endswith(':'):
+        return float(value[:-1]), True
+    return float(value), False
+
+
+def format_limit(limit):
+    if limit is None:
+        return ''
+    value, is_minimum = limit
+    return '%g:' % value if is_minimum else '%g' % value
+
+
+class Thresholds(object):
+
+    def __init__(self):
+        self.limits = dict((kind, []) for kind in KINDS)
+
+    @classmethod
+    def load(cls, path):
+        thresholds = cls()
+        with open(path) as f:
+            for number, line in enumerate(f, 1):
+                line = line.split('#', 1)[0].strip()
+                if not line:
+                    continue
+                fields = line.split()
+                if len(fields) != 4 or fields[0] not in KINDS:
+                    raise ValueError("%s:%d : expected '<phase|test> "
+                                     "<regex> <warning> <critical>'" %
+                                     (path, number))
+                kind, pattern, warning, critical = fields
+                thresholds.limits[kind].append(
+                    (re.compile(pattern), _limit(warning), _limit(critical)))
+        return thresholds
+
+    def get(self, kind, name):
+        """Return (warning, critical) for the phase or test, or None"""
+        for pattern, warning, critical in self.limits[kind]:
+            if pattern.search(name):
+                return warning, critical
+        return None
+
+
+def check(label, value, unit, limits):
+    """Return ('critical' or 'warning', message) or None"""
+    warning, critical = limits
+    for level, limit in (('critical', critical), ('warning', warning)):
+        if limit is None:
+            continue
+        limit, is_minimum = limit
+        if is_minimum and value < limit:
+            sign = '<'
+        elif not is_minimum and value > limit:
+            sign = '>'
+        else:
+            continue
+        return level, '%s=%g%s %s %g%s (%s)' % (label, value, unit, sign,
+                                                limit, unit, level)
+    return None
+
+# EOF
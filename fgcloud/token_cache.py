@@ -0,0 +1,225 @@
+# Copyright 2015 France-Grilles - IDGC - CNRS
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+"""Keystone tokens shared by the checks through files
+
+The token of each set of credentials is stored in [fgcloud]/token_cache_dir
+and reused by the next checks until [fgcloud]/token_cache_margin seconds
+before it expires. A lock per set of credentials makes the concurrent checks
+wait for the one that authenticates instead of all asking Keystone.
+
+A cached token rejected by Keystone (revoked, Keystone restarted with UUID
+tokens, fernet keys rotated) is removed from the cache and the request is
+sent once more with a new token.
+
+With FGCLOUD_FRESH_AUTH set (check_openstack.sh -f), the cached tokens are
+not used: each check authenticates, to test Keystone itself, and stores the
+new tokens.
+"""
+import contextlib
+import fcntl
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+
+from oslo_log import log as logging
+from oslo_utils import timeutils
+
+from tempest.api.fgcloud import options  # noqa
+from tempest.api.fgcloud import perfdata
+from tempest import config
+
+CONF = config.CONF
+LOG = logging.getLogger(__name__)
+
+FRESH_AUTH_ENV = 'FGCLOUD_FRESH_AUTH'
+
+_lock = threading.Lock()
+_stats = {'hits': 0, 'misses': 0, 'rejected': 0, 'auth_time': 0.0}
+_installed = []
+
+
+def _credentials_key(auth_url, credentials):
+    # The password is part of the key, only its hash is written
+    values = [auth_url] + [str(getattr(credentials, attr, None)) for attr in (
+        'username', 'user_domain_name', 'tenant_name', 'project_name',
+        'project_domain_name', 'password')]
+    return hashlib.sha256('\n'.join(values).encode('utf-8')).hexdigest()
+
+
+def _expires_at(auth_data):
+    # Keystone v3 token body, or v2 access
+    expires = auth_data.get('expires_at') or auth_data.get(
+        'token', {}).get('expires')
+    return timeutils.normalize_time(timeutils.parse_isotime(expires))
+
+
+class TokenCache(object):
+
+    def __init__(self, directory, margin):
+        self.directory = directory
+        self.margin = margin
+
+    def _path(self, key):
+        return os.path.join(self.directory, '%s.json' % key)
+
+    @contextlib.contextmanager
+    def locked(self, key):
+        """Hold an exclusive lock on the token of a set of credentials"""
+        if not os.path.isdir(self.directory):
+            os.makedirs(self.directory, 0o700)
+        with open(self._path(key) + '.lock', 'a') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def load(self, key):
+        """Return (token, auth_data), None if missing or expiring soon"""
+        path = self._path(key)
+        if not os.path.exists(path):
+            return None
+        with open(path) as f:
+            try:
+                entry = json.load(f)
+                expires_at = _expires_at(entry['auth_data'])
+            except (ValueError, KeyError, TypeError, AttributeError):
+                # Broken file, a new token will be stored
+                return None
+        if timeutils.delta_seconds(timeutils.utcnow(),
+                                   expires_at) < self.margin:
+            return None
+        return entry['token'], entry['auth_data']
+
+    def save(self, key, token, auth_data):
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, prefix='.token.')
+        os.fchmod(fd, 0o600)
+        with os.fdopen(fd, 'w') as f:
+            json.dump({'token': token, 'auth_data': auth_data}, f)
+        os.rename(tmp_path, self._path(key))
+
+    def delete(self, key, token):
+        """Remove the cached token, unless another one replaced it"""
+        with self.locked(key):
+            cached = self.load(key)
+            if cached is not None and cached[0] == token:
+                os.remove(self._path(key))
+
+
+def _count(name, value=1):
+    with _lock:
+        _stats[name] += value
+
+
+def report():
+    """Add the number of cached and new tokens and the time to get them"""
+    with _lock:
+        stats = dict(_stats)
+        _stats.update(hits=0, misses=0, rejected=0, auth_time=0.0)
+    if stats['hits'] or stats['misses']:
+        perfdata.add('token_cache_hits', stats['hits'])
+        perfdata.add('token_cache_misses', stats['misses'])
+        perfdata.add('token_cache_rejected', stats['rejected'])
+        perfdata.add('auth_time', stats['auth_time'], 's')
+
+
+perfdata.on_flush(report)
+
+
+def wrap(provider, cache, fresh=False):
+    """Make an auth provider get its tokens through the cache"""
+    get_auth = provider._get_auth
+    key = _credentials_key(provider.auth_url, provider.credentials)
+
+    def cached_get_auth():
+        with cache.locked(key):
+            cached = None if fresh else cache.load(key)
+            if cached is not None:
+                _count('hits')
+                provider.cached_token = cached[0]
+                return cached
+            provider.cached_token = None
+            start = time.time()
+            token, auth_data = get_auth()
+            _count('misses')
+            _count('auth_time', time.time() - start)
+            try:
+                cache.save(key, token, auth_data)
+            except (IOError, OSError, TypeError) as exc:
+                LOG.warning("Cannot store the token : %s" % exc)
+            return token, auth_data
+
+    def evict():
+        """Forget a token rejected by Keystone, the next call gets another"""
+        token = provider.cached_token
+        if token is not None:
+            LOG.warning("Cached token rejected, authenticating again")
+            _count('rejected')
+            provider.cached_token = None
+            try:
+                cache.delete(key, token)
+            except (IOError, OSError) as exc:
+                LOG.warning("Cannot remove the token : %s" % exc)
+        provider.clear_auth()
+
+    provider.cached_token = None
+    provider.evict_token = evict
+    provider._get_auth = cached_get_auth
+    return provider
+
+
+def install():
+    """Use the cache for the auth providers of the tempest clients"""
+    if _installed or not CONF.fgcloud.token_cache:
+        return
+    try:
+        from tempest.lib.common import rest_client
+        from tempest.lib import exceptions as lib_exc
+        from tempest import manager
+        get_auth_provider = manager.get_auth_provider
+        request = rest_client.RestClient.request
+    except (ImportError, AttributeError):
+        LOG.warning("This version of tempest cannot share auth providers, "
+                    "the tokens will not be cached")
+        return
+    cache = TokenCache(CONF.fgcloud.token_cache_dir,
+                       CONF.fgcloud.token_cache_margin)
+    fresh = bool(os.environ.get(FRESH_AUTH_ENV))
+
+    def cached_get_auth_provider(credentials, *args, **kwargs):
+        provider = get_auth_provider(credentials, *args, **kwargs)
+        if hasattr(provider, '_get_auth'):
+            wrap(provider, cache, fresh)
+        return provider
+
+    def retried_request(self, *args, **kwargs):
+        try:
+            return request(self, *args, **kwargs)
+        except lib_exc.Unauthorized:
+            evict = getattr(self.auth_provider, 'evict_token', None)
+            if evict is None:
+                raise
+            # Once, a new token that is rejected too is a real failure
+            evict()
+            return request(self, *args, **kwargs)
+
+    manager.get_auth_provider = cached_get_auth_provider
+    rest_client.RestClient.request = retried_request
+    _installed.append(cache)
+
+# EOF
@@ -0,0 +1,147 @@
+# Copyright 2015 France-Grilles - IDGC - CNRS
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+"""I/O benchmark of the attached volume, run over SSH in the server
+
+Each workload (sequential or random, read or write) runs for a fixed time
+on the first [fgcloud]/volume_benchmark_size MB of the raw device, so the
+whole benchmark fits in a monitoring slot whatever the storage speed. The
+data of the volume are overwritten.
+
+fio is used when the image has it. Otherwise (ie. cirros) a shell loop of
+dd, one block per dd process: the random IOPS then include the cost of
+starting dd and are only comparable between runs of the same image.
+"""
+import json
+
+from tempest.api.fgcloud import options  # noqa
+from tempest import config
+
+CONF = config.CONF
+
+# name: (fio rw, read or write, random)
+WORKLOADS = {
+    'seq_read': ('read', 'read', False),
+    'seq_write': ('write', 'write', False),
+    'rand_read': ('randread', 'read', True),
+    'rand_write': ('randwrite', 'write', True),
+}
+
+SEQUENTIAL_BLOCK_KB = 1024
+
+# Prints '<blocks done> <start> <end>', times from /proc/uptime
+DD_LOOP = (
+    "n=0; r=$$; stop=$(($(date +%%s) + %(runtime)d)); "
+    "read start rest < /proc/uptime; "
+    "while [ $(date +%%s) -lt $stop ]; do "
+    "%(index)s; "
+    "dd %(io)s bs=%(block_kb)dk count=1 %(flags)s 2>/dev/null || exit 1; "
+    "n=$((n + 1)); "
+    "done; "
+    "read end rest < /proc/uptime; "
+    "echo $n $start $end")
+
+
+def _block_kb(random):
+    if random:
+        return CONF.fgcloud.volume_benchmark_block_size
+    return SEQUENTIAL_BLOCK_KB
+
+
+def fio_command(device, name):
+    fio_rw, _, random = WORKLOADS[name]
+    return ('sudo fio --name=%s --filename=%s --rw=%s --bs=%dk --size=%dM '
+            '--direct=1 --time_based --runtime=%d --output-format=json' % (
+                name, device, fio_rw, _block_kb(random),
+                CONF.fgcloud.volume_benchmark_size,
+                CONF.fgcloud.volume_benchmark_runtime))
+
+
+def parse_fio(output, name):
+    """Return (MB/s, IOPS, mean latency in ms) from the fio json output"""
+    # Some versions print warnings before the json
+    job = json.loads(output[output.index('{'):])['jobs'][0]
+    stats = job[WORKLOADS[name][1]]
+    if 'lat_ns' in stats:
+        latency = stats['lat_ns']['mean'] / 1e6
+    else:
+        latency = stats['lat']['mean'] / 1e3
+    return stats['bw'] / 1024.0, stats['iops'], latency
+
+
+def dd_command(device, name, direct=True):
+    _, direction, random = WORKLOADS[name]
+    block_kb = _block_kb(random)
+    blocks = CONF.fgcloud.volume_benchmark_size * 1024 // block_kb
+    if random:
+        # No $RANDOM in dash, a linear congruential generator instead
+        index = ('r=$(((r * 1103515245 + 12345) %% 2147483648)); '
+                 'i=$((r %% %d))' % blocks)
+    else:
+        index = 'i=$((n %% %d))' % blocks
+    if direction == 'read':
+        io = 'if=%s of=/dev/null skip=$i' % device
+        flags = 'iflag=direct' if direct else ''
+    else:
+        io = 'if=/dev/zero of=%s seek=$i conv=notrunc' % device
+        flags = 'oflag=direct' if direct else 'conv=fsync'
+    loop = DD_LOOP % {'runtime': CONF.fgcloud.volume_benchmark_runtime,
+                      'index': index, 'io': io, 'block_kb': block_kb,
+                      'flags': flags}
+    if direction == 'read' and not direct:
+        loop = 'sync; echo 3 > /proc/sys/vm/drop_caches; ' + loop
+    return "sudo sh -c '%s'" % loop
+
+
+def parse_dd(output, name, device):
+    """Return (MB/s, IOPS, mean latency in ms) from the dd loop output"""
+    # The loop exits without its "blocks start end" line when a dd fails
+    try:
+        blocks, start, end = output.split()[-3:]
+        blocks = int(blocks)
+        elapsed = max(float(end) - float(start), 0.01)
+    except ValueError:
+        raise ValueError("dd benchmark failed on %s : %r" % (device, output))
+    block_kb = _block_kb(WORKLOADS[name][2])
+    latency = elapsed * 1000 / blocks if blocks else elapsed * 1000
+    return blocks * block_kb / 1024.0 / elapsed, blocks / elapsed, latency
+
+
+def run(ssh_client, device):
+    """Run the configured workloads, return [(name, MB/s, IOPS, ms)]"""
+    has_fio = bool(ssh_client.exec_command(
+        'which fio 2>/dev/null || true').strip())
+    direct = True
+    if not has_fio:
+        # Old busybox dd have no iflag/oflag
+        probe = ssh_client.exec_command(
+            'sudo dd if=%s of=/dev/null bs=4k count=1 iflag=direct '
+            '2>/dev/null && echo ok || true' % device)
+        direct = 'ok' in probe
+    workloads = CONF.fgcloud.volume_benchmark_workloads
+    unknown = [name for name in workloads if name not in WORKLOADS]
+    if unknown:
+        raise ValueError("Unknown volume_benchmark_workloads %s, expected "
+                         "%s" % (unknown, sorted(WORKLOADS)))
+    results = []
+    for name in workloads:
+        if has_fio:
+            output = ssh_client.exec_command(fio_command(device, name))
+            results.append((name,) + parse_fio(output, name))
+        else:
+            output = ssh_client.exec_command(dd_command(device, name, direct))
+            results.append((name,) + parse_dd(output, name, device))
+    return results
+
+# EOF
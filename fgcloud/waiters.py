@@ -0,0 +1,200 @@
+# Copyright 2015 France-Grilles - IDGC - CNRS
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+"""Waiters with adaptive polling
+
+Same interface as tempest.common.waiters, but instead of a fixed
+build_interval the first polls are fast then the interval grows until
+[fgcloud]/poll_max_interval (see options.py). The number of polls and the
+time spent waiting are summed by kind of resource and sent as perfdata.
+"""
+import collections
+import threading
+import time
+
+import fixtures
+from oslo_log import log as logging
+from tempest.api.fgcloud import options  # noqa
+from tempest.api.fgcloud import perfdata
+from tempest import config
+from tempest import exceptions
+from tempest.lib import exceptions as lib_exc
+
+CONF = config.CONF
+LOG = logging.getLogger(__name__)
+
+_lock = threading.Lock()
+_stats = collections.OrderedDict()
+
+
+def _record(kind, polls, elapsed):
+    with _lock:
+        waits, total_polls, total_time = _stats.get(kind, (0, 0, 0.0))
+        _stats[kind] = (waits + 1, total_polls + polls, total_time + elapsed)
+
+
+def report():
+    """Add the number of waits, polls and the time spent by kind"""
+    with _lock:
+        stats = list(_stats.items())
+        _stats.clear()
+    for kind, (waits, polls, elapsed) in stats:
+        perfdata.add('%s_waits' % kind, waits)
+        perfdata.add('%s_polls' % kind, polls)
+        perfdata.add('%s_wait_time' % kind, elapsed, 's')
+
+
+perfdata.on_flush(report)
+
+
+def intervals():
+    """Generate the sleep times between two polls"""
+    interval = CONF.fgcloud.poll_initial_interval
+    max_interval = CONF.fgcloud.poll_max_interval
+    while True:
+        yield min(interval, max_interval)
+        interval *= CONF.fgcloud.poll_backoff
+
+
+def poll(check, timeout, kind):
+    """Call check() until it returns True or the timeout expires
+
+    Return True if check() succeeded. Exceptions raised by check() are not
+    caught (ie. to stop waiting on an ERROR status).
+    """
+    start = time.time()
+    polls = 0
+    done = False
+    try:
+        for interval in intervals():
+            polls += 1
+            if check():
+                done = True
+                break
+            remaining = timeout - (time.time() - start)
+            if remaining <= 0:
+                break
+            time.sleep(min(interval, remaining))
+    finally:
+        elapsed = time.time() - start
+        _record(kind, polls, elapsed)
+        LOG.info("Waited %.1fs (%d polls) for %s" % (elapsed, polls, kind))
+    return done
+
+
+def call_until_true(func, duration, kind='call'):
+    """Adaptive version of tempest.test.call_until_true"""
+    return poll(func, duration, kind)
+
+
+def wait_for_server_status(client, server_id, status, ready_wait=True,
+                           extra_timeout=0, raise_on_error=True,
+                           request_id=None):
+    """Waits for a server to reach a given status."""
+
+    def check():
+        body = client.show_server(server_id)['server']
+        server_status = body['status']
+        task_state = body.get('OS-EXT-STS:task_state')
+        if server_status == 'ERROR' and raise_on_error:
+            if 'fault' in body:
+                raise exceptions.BuildErrorException(body['fault'],
+                                                     server_id=server_id)
+            raise exceptions.BuildErrorException(server_id=server_id)
+        return server_status == status and (task_state is None or
+                                            not ready_wait)
+
+    timeout = client.build_timeout + extra_timeout
+    if not poll(check, timeout, 'server'):
+        message = ('Server %s failed to reach %s status within the required '
+                   'time (%s s).' % (server_id, status, timeout))
+        raise exceptions.TimeoutException(message)
+
+
+def wait_for_volume_status(client, volume_id, status):
+    """Waits for a Volume to reach a given status."""
+
+    def check():
+        volume_status = client.show_volume(volume_id)['volume']['status']
+        if volume_status == 'error':
+            raise exceptions.VolumeBuildErrorException(volume_id=volume_id)
+        return volume_status == status
+
+    if not poll(check, client.build_timeout, 'volume'):
+        message = ('Volume %s failed to reach %s status within the required '
+                   'time (%s s).' % (volume_id, status, client.build_timeout))
+        raise exceptions.TimeoutException(message)
+
+
+def wait_for_snapshot_status(client, snapshot_id, status):
+    """Waits for a Snapshot to reach a given status."""
+
+    def check():
+        body = client.show_snapshot(snapshot_id)['snapshot']
+        if body['status'] == 'error':
+            raise exceptions.SnapshotBuildErrorException(
+                snapshot_id=snapshot_id)
+        return body['status'] == status
+
+    if not poll(check, client.build_timeout, 'snapshot'):
+        message = ('Snapshot %s failed to reach %s status within the required '
+                   'time (%s s).' % (snapshot_id, status,
+                                     client.build_timeout))
+        raise exceptions.TimeoutException(message)
+
+
+def wait_for_image_status(client, image_id, status):
+    """Waits for an image to reach a given status."""
+
+    def check():
+        image = client.show_image(image_id)
+        # Compute image client returns response wrapped in 'image' element
+        if 'image' in image:
+            image = image['image']
+        if image['status'].lower() == 'error':
+            raise exceptions.AddImageException(image_id=image_id)
+        return image['status'] == status
+
+    if not poll(check, client.build_timeout, 'image'):
+        message = ('Image %s failed to reach %s status within the required '
+                   'time (%s s).' % (image_id, status, client.build_timeout))
+        raise exceptions.TimeoutException(message)
+
+
+def wait_for_resource_deletion(client, resource_id):
+    """Adaptive version of RestClient.wait_for_resource_deletion"""
+
+    def check():
+        return client.is_resource_deleted(resource_id)
+
+    if not poll(check, client.build_timeout, 'deletion'):
+        message = ('Failed to delete %s %s within the required time (%s s).'
+                   % (client.resource_type, resource_id,
+                      client.build_timeout))
+        raise lib_exc.TimeoutException(message)
+
+
+class AdaptiveWaiters(fixtures.Fixture):
+    """Use these waiters in the tempest helpers (ie. create_server)"""
+
+    WAITERS = ('wait_for_server_status', 'wait_for_volume_status',
+               'wait_for_snapshot_status', 'wait_for_image_status')
+
+    def setUp(self):
+        super(AdaptiveWaiters, self).setUp()
+        for name in self.WAITERS:
+            self.useFixture(fixtures.MonkeyPatch(
+                'tempest.common.waiters.%s' % name, globals()[name]))
+
+# EOF
@@ -0,0 +1,86 @@
+# Copyright 2015 France-Grilles - IDGC - CNRS
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+"""Admin session shared by the account tools
+
+The admin credentials are read once from config/admin-creds (the OS_*
+exports), the OS_* variables of the environment taking precedence. The
+Keystone and Neutron clients then share the same authenticated session.
+"""
+import os
+import re
+import sys
+
+from keystoneauth1.identity import v2
+from keystoneauth1 import session
+from keystoneclient.v2_0 import client as keystone_client
+from neutronclient.v2_0 import client as neutron_client
+
+REPO_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+ADMIN_CREDS = os.path.join(REPO_DIR, 'config', 'admin-creds')
+ACCOUNTS_FILE = os.path.join(REPO_DIR, 'config', 'accounts.yaml')
+
+# The thread pool of the fgcloud tests (it needs six and oslo.log, not
+# tempest)
+sys.path.insert(0, REPO_DIR)
+from fgcloud import concurrency  # noqa
+
+EXPORT_PATTERN = re.compile(r'^\s*export\s+(OS_\w+)=(.*)$')
+
+
+def load_admin_creds(path=ADMIN_CREDS):
+    creds = {}
+    if os.path.exists(path):
+        with open(path) as f:
+            for line in f:
+                match = EXPORT_PATTERN.match(line)
+                if match:
+                    creds[match.group(1)] = match.group(2).strip().strip('"\'')
+    for name, value in os.environ.items():
+        if name.startswith('OS_'):
+            creds[name] = value
+    missing = [name for name in ('OS_AUTH_URL', 'OS_USERNAME', 'OS_PASSWORD',
+                                 'OS_TENANT_NAME') if not creds.get(name)]
+    if missing:
+        raise ValueError("Missing admin credentials in %s : %s" %
+                         (path, ', '.join(missing)))
+    return creds
+
+
+def get_clients(creds):
+    """Log in once, return the (keystone, neutron) admin clients"""
+    auth = v2.Password(auth_url=creds['OS_AUTH_URL'],
+                       username=creds['OS_USERNAME'],
+                       password=creds['OS_PASSWORD'],
+                       tenant_name=creds['OS_TENANT_NAME'])
+    sess = session.Session(auth=auth)
+    # Get the token now, not once per thread
+    sess.get_token()
+    return (keystone_client.Client(session=sess),
+            neutron_client.Client(session=sess))
+
+
+def add_common_arguments(parser):
+    parser.add_argument('--admin-creds', default=ADMIN_CREDS,
+                        help="File with the OS_* exports of the admin user "
+                             "(default : %(default)s)")
+    parser.add_argument('--prefix', default='tempest',
+                        help="Prefix of the names of the tenants, users and "
+                             "network resources (default : %(default)s)")
+    parser.add_argument('--workers', type=int,
+                        default=concurrency.DEFAULT_WORKERS,
+                        help="Number of API calls run in parallel "
+                             "(default : %(default)s)")
+
+# EOF
@@ -0,0 +1,201 @@
+#!/usr/bin/env python
+# Copyright 2015 France-Grilles - IDGC - CNRS
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+"""Delete the static accounts created by create_tempest_users.py
+
+The users, tenants, routers, subnets and networks whose name starts with the
+prefix are deleted with a single admin session and a pool of threads. Each
+resource goes as soon as the ones depending on it are gone: the router
+interfaces before their subnet, the subnets before their network. The users
+and tenants go at the same time as the network resources.
+
+Exemple : tools/clear_tempest.py --dry-run
+"""
+import argparse
+import collections
+import logging
+import sys
+import time
+
+from keystoneclient import exceptions as keystone_exc
+from neutronclient.common import exceptions as neutron_exc
+
+import admin_session
+from admin_session import concurrency
+
+LOG = logging.getLogger('clear_tempest')
+
+NOT_FOUND = (keystone_exc.NotFound, neutron_exc.NotFound)
+
+
+def retry(func, retries, delay):
+    """Call func until it succeeds, NotFound meaning already deleted"""
+    for attempt in range(retries + 1):
+        try:
+            return func()
+        except NOT_FOUND:
+            return
+        except Exception as exc:
+            if attempt == retries:
+                raise
+            LOG.warning("Retrying in %ds : %s" % (delay, exc))
+            time.sleep(delay)
+            delay *= 2
+
+
+class Cleaner(object):
+
+    def __init__(self, keystone, neutron, args):
+        self.keystone = keystone
+        self.neutron = neutron
+        self.args = args
+        self.graph = concurrency.TaskGraph(args.workers,
+                                           cancel_on_error=False)
+        self.plan = []
+
+    def _matches(self, name):
+        return (name or '').startswith(self.args.prefix)
+
+    def add(self, name, label, func, requires=()):
+        self.plan.append((name, label, list(requires)))
+
+        def delete():
+            retry(func, self.args.retries, self.args.retry_delay)
+        self.graph.add(name, delete, requires=requires)
+
+    def build(self):
+        """List the resources once and add their deletion to the graph"""
+        for user in self.keystone.users.list():
+            if self._matches(user.name):
+                self.add('user_%s' % user.id, 'user %s' % user.name,
+                         lambda u=user.id: self.keystone.users.delete(u))
+        for tenant in self.keystone.tenants.list():
+            if self._matches(tenant.name):
+                self.add('tenant_%s' % tenant.id, 'tenant %s' % tenant.name,
+                         lambda t=tenant.id: self.keystone.tenants.delete(t))
+
+        routers = [r for r in self.neutron.list_routers()['routers']
+                   if self._matches(r['name'])]
+        subnets = [s for s in self.neutron.list_subnets()['subnets']
+                   if self._matches(s['name'])]
+        networks = [n for n in self.neutron.list_networks()['networks']
+                    if self._matches(n['name'])]
+        router_ids = set(r['id'] for r in routers)
+        interfaces = collections.defaultdict(list)
+        ports = self.neutron.list_ports(
+            device_owner='network:router_interface')['ports']
+        for port in ports:
+            if port['device_id'] not in router_ids:
+                continue
+            for fixed_ip in port['fixed_ips']:
+                interfaces[port['device_id']].append(fixed_ip['subnet_id'])
+
+        # Subnet id -> tasks that must be done before deleting it
+        subnet_requires = collections.defaultdict(list)
+        for router in routers:
+            router_id = router['id']
+            self.add('gateway_%s' % router_id,
+                     'gateway of router %s' % router['name'],
+                     lambda r=router_id: self.neutron.remove_gateway_router(r))
+            requires = ['gateway_%s' % router_id]
+            for subnet_id in set(interfaces[router_id]):
+                name = 'interface_%s_%s' % (router_id, subnet_id)
+                self.add(name, 'interface of router %s on subnet %s' %
+                         (router['name'], subnet_id),
+                         self._remove_interface(router_id, subnet_id))
+                requires.append(name)
+                subnet_requires[subnet_id].append(name)
+            self.add('router_%s' % router_id, 'router %s' % router['name'],
+                     lambda r=router_id: self.neutron.delete_router(r),
+                     requires=requires)
+
+        # Network id -> subnet deletions
+        network_requires = collections.defaultdict(list)
+        for subnet in subnets:
+            name = 'subnet_%s' % subnet['id']
+            self.add(name, 'subnet %s' % subnet['name'],
+                     lambda s=subnet['id']: self.neutron.delete_subnet(s),
+                     requires=subnet_requires[subnet['id']])
+            network_requires[subnet['network_id']].append(name)
+        for network in networks:
+            self.add('network_%s' % network['id'],
+                     'network %s' % network['name'],
+                     lambda n=network['id']: self.neutron.delete_network(n),
+                     requires=network_requires[network['id']])
+
+    def _remove_interface(self, router_id, subnet_id):
+        def remove():
+            self.neutron.remove_interface_router(router_id,
+                                                 {'subnet_id': subnet_id})
+        return remove
+
+    def print_plan(self):
+        labels = dict((name, label) for name, label, _ in self.plan)
+        for name, label, requires in self.plan:
+            if requires:
+                after = ', '.join(labels[r] for r in requires)
+                print("%s (after %s)" % (label, after))
+            else:
+                print(label)
+
+    def run(self):
+        start = time.time()
+        self.graph.run(raise_on_error=False)
+        labels = dict((name, label) for name, label, _ in self.plan)
+        for name, exc_info in self.graph.errors.items():
+            LOG.error("Cannot delete %s : %s" % (labels[name], exc_info[1]))
+        LOG.info("%d deletion(s) done, %d failed in %.1fs" %
+                 (len(self.graph.results), len(self.graph.errors),
+                  time.time() - start))
+        return not self.graph.errors
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Delete the static accounts of tempest")
+    admin_session.add_common_arguments(parser)
+    parser.add_argument('--dry-run', action='store_true',
+                        help="Only print what would be deleted")
+    parser.add_argument('--retries', type=int, default=3,
+                        help="Attempts after a failed deletion "
+                             "(default : %(default)s)")
+    parser.add_argument('--retry-delay', type=int, default=2,
+                        help="Seconds before the first retry, doubled after "
+                             "each one (default : %(default)s)")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO,
+                        format='%(asctime)s %(levelname)s %(message)s')
+
+    try:
+        creds = admin_session.load_admin_creds(args.admin_creds)
+    except ValueError as exc:
+        parser.error(str(exc))
+    keystone, neutron = admin_session.get_clients(creds)
+
+    cleaner = Cleaner(keystone, neutron, args)
+    cleaner.build()
+    if not cleaner.plan:
+        LOG.info("Nothing to delete with the prefix %s" % args.prefix)
+        return 0
+    if args.dry_run:
+        cleaner.print_plan()
+        return 0
+    return 0 if cleaner.run() else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
+
+# EOF
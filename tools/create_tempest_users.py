@@ -0,0 +1,274 @@
+#!/usr/bin/env python
+# Copyright 2015 France-Grilles - IDGC - CNRS
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+"""Create the static accounts of tempest and write accounts.yaml
+
+Each account gets a tenant, a user, a network with one subnet and a router
+plugged to the external network. Everything is created with a single admin
+session and a pool of threads, then the accounts that were fully created
+are added to accounts.yaml (replacing the ones with the same username),
+which is replaced atomically.
+
+Exemple : tools/create_tempest_users.py --count 12
+"""
+import argparse
+import collections
+import logging
+import os
+import random
+import socket
+import string
+import struct
+import sys
+import tempfile
+
+import yaml
+
+import admin_session
+from admin_session import concurrency
+
+LOG = logging.getLogger('create_tempest_users')
+
+PASSWORD_CHARS = string.ascii_letters + string.digits + '_'
+
+
+def generate_password(length=16):
+    rand = random.SystemRandom()
+    return ''.join(rand.choice(PASSWORD_CHARS) for _ in range(length))
+
+
+def allocate_subnets(pool, prefixlen, indexes):
+    """Return {index: (cidr, gateway)}, the index-th subnet of the pool"""
+    address, pool_prefixlen = pool.split('/')
+    pool_prefixlen = int(pool_prefixlen)
+    if not pool_prefixlen <= prefixlen <= 30:
+        raise ValueError("Cannot split %s in /%d subnets" % (pool, prefixlen))
+    size = 1 << (32 - prefixlen)
+    mask = (0xffffffff << (32 - pool_prefixlen)) & 0xffffffff
+    base = struct.unpack('!I', socket.inet_aton(address))[0] & mask
+    available = 1 << (prefixlen - pool_prefixlen)
+    subnets = {}
+    for index in indexes:
+        if index >= available:
+            raise ValueError("%s only holds %d /%d subnets, cannot allocate "
+                             "the subnet %d" % (pool, available, prefixlen,
+                                                index))
+        start = base + index * size
+        cidr = '%s/%d' % (socket.inet_ntoa(struct.pack('!I', start)),
+                          prefixlen)
+        gateway = socket.inet_ntoa(struct.pack('!I', start + 1))
+        subnets[index] = (cidr, gateway)
+    return subnets
+
+
+class Provisioner(object):
+
+    def __init__(self, keystone, neutron, args):
+        self.keystone = keystone
+        self.neutron = neutron
+        self.args = args
+        self.graph = concurrency.TaskGraph(args.workers)
+        self.passwords = {}
+
+    def get_external_network(self):
+        networks = self.neutron.list_networks(
+            name=self.args.external_network)['networks']
+        if not networks:
+            raise ValueError("External network %s not found" %
+                             self.args.external_network)
+        return networks[0]['id']
+
+    def add_account(self, index, subnet, ext_net_id):
+        """Add the tasks creating one account to the graph"""
+        prefix = self.args.prefix
+        results = self.graph.results
+        password = generate_password()
+        self.passwords[index] = password
+
+        def key(kind):
+            return '%s_%d' % (kind, index)
+
+        def create_tenant():
+            tenant = self.keystone.tenants.create(
+                tenant_name='%s_tenant_%d' % (prefix, index),
+                description='Tempest tenant %d' % index)
+            return tenant.id
+
+        def create_user():
+            user = self.keystone.users.create(
+                name='%s_user_%d' % (prefix, index), password=password,
+                tenant_id=results[key('tenant')])
+            return user.id
+
+        def create_network():
+            body = {'network': {'name': '%s_net_%d' % (prefix, index),
+                                'tenant_id': results[key('tenant')]}}
+            return self.neutron.create_network(body)['network']['id']
+
+        def create_subnet():
+            cidr, gateway = subnet
+            body = {'subnet': {'name': '%s_subnet_%d' % (prefix, index),
+                               'network_id': results[key('network')],
+                               'tenant_id': results[key('tenant')],
+                               'ip_version': 4,
+                               'cidr': cidr,
+                               'gateway_ip': gateway}}
+            return self.neutron.create_subnet(body)['subnet']['id']
+
+        def create_router():
+            body = {'router': {'name': '%s_router_%d' % (prefix, index),
+                               'tenant_id': results[key('tenant')],
+                               'external_gateway_info': {
+                                   'network_id': ext_net_id}}}
+            return self.neutron.create_router(body)['router']['id']
+
+        def add_interface():
+            self.neutron.add_interface_router(
+                results[key('router')], {'subnet_id': results[key('subnet')]})
+
+        self.graph.add(key('tenant'), create_tenant)
+        self.graph.add(key('user'), create_user, requires=[key('tenant')])
+        self.graph.add(key('network'), create_network,
+                       requires=[key('tenant')])
+        self.graph.add(key('subnet'), create_subnet,
+                       requires=[key('network')])
+        self.graph.add(key('router'), create_router,
+                       requires=[key('tenant')])
+        self.graph.add(key('interface'), add_interface,
+                       requires=[key('subnet'), key('router')])
+
+    def is_complete(self, index):
+        return all('%s_%d' % (kind, index) in self.graph.results
+                   for kind in ('user', 'interface'))
+
+
+def quote(value):
+    return "'%s'" % str(value).replace("'", "''")
+
+
+def format_account(entry, comment=None):
+    """Lines of an account, in the format of config/accounts.yaml"""
+    lines = [""]
+    if comment:
+        lines.append("# %s" % comment)
+    if set(entry) - set(['username', 'tenant_name', 'password',
+                         'resources']):
+        # Other fields (roles, types...) written by hand, keep them as is
+        dump = yaml.safe_dump([entry], default_flow_style=False)
+        return lines + dump.rstrip('\n').split('\n')
+    lines.extend(["- username: %s" % quote(entry['username']),
+                  "  tenant_name: %s" % quote(entry['tenant_name']),
+                  "  password: %s" % quote(entry['password'])])
+    if entry.get('resources'):
+        lines.append("  resources:")
+        for name, value in sorted(entry['resources'].items()):
+            lines.append("    %s: %s" % (name, quote(value)))
+    return lines
+
+
+def write_accounts(path, prefix, indexes, passwords):
+    """Write the accounts in path, keeping the other accounts of the file
+
+    An account of the file with the same username is replaced, so that
+    --first does not drop the accounts created before.
+    """
+    accounts = collections.OrderedDict()
+    if os.path.exists(path):
+        with open(path) as f:
+            for entry in yaml.safe_load(f) or []:
+                accounts[entry['username']] = (entry, None)
+    for index in indexes:
+        username = '%s_user_%d' % (prefix, index)
+        accounts[username] = ({'username': username,
+                               'tenant_name': '%s_tenant_%d' % (prefix,
+                                                                index),
+                               'password': passwords[index],
+                               'resources': {
+                                   'network': '%s_net_%d' % (prefix, index)}},
+                              "Test user %d" % index)
+
+    lines = ["# Generated users for use with tempest API",
+             "",
+             "# See officiel tempest documentation regarding parallel tests",
+             "# You may need to create 2 times the number of concurrent test"]
+    for entry, comment in accounts.values():
+        lines.extend(format_account(entry, comment))
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.accounts.')
+    os.fchmod(fd, 0o600)
+    with os.fdopen(fd, 'w') as f:
+        f.write('\n'.join(lines) + '\n')
+    os.rename(tmp_path, path)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Create the static accounts of tempest")
+    admin_session.add_common_arguments(parser)
+    parser.add_argument('-n', '--count', type=int, default=6,
+                        help="Number of accounts to create, twice the number "
+                             "of parallel workers (default : %(default)s)")
+    parser.add_argument('--first', type=int, default=1,
+                        help="Number of the first account "
+                             "(default : %(default)s)")
+    parser.add_argument('--external-network', default='ext-net',
+                        help="Network of the router gateways "
+                             "(default : %(default)s)")
+    parser.add_argument('--subnet-pool', default='10.240.0.0/16',
+                        help="Range split in one subnet per account, account "
+                             "N gets the N-th subnet (default : %(default)s)")
+    parser.add_argument('--subnet-prefix', type=int, default=24,
+                        help="Size of the subnets (default : %(default)s)")
+    parser.add_argument('-o', '--output', default=admin_session.ACCOUNTS_FILE,
+                        help="accounts.yaml file to write, its other "
+                             "accounts are kept (default : %(default)s)")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO,
+                        format='%(asctime)s %(levelname)s %(message)s')
+
+    indexes = list(range(args.first, args.first + args.count))
+    try:
+        subnets = allocate_subnets(args.subnet_pool, args.subnet_prefix,
+                                   indexes)
+        creds = admin_session.load_admin_creds(args.admin_creds)
+    except ValueError as exc:
+        parser.error(str(exc))
+
+    keystone, neutron = admin_session.get_clients(creds)
+    provisioner = Provisioner(keystone, neutron, args)
+    ext_net_id = provisioner.get_external_network()
+    for index in indexes:
+        provisioner.add_account(index, subnets[index], ext_net_id)
+    provisioner.graph.run(raise_on_error=False)
+
+    for name, exc_info in provisioner.graph.errors.items():
+        LOG.error("Cannot create %s : %s" % (name, exc_info[1]))
+    created = [i for i in indexes if provisioner.is_complete(i)]
+    failed = [i for i in indexes if i not in created]
+    if created:
+        write_accounts(args.output, args.prefix, created,
+                       provisioner.passwords)
+        LOG.info("%d account(s) written to %s" % (len(created), args.output))
+    if failed:
+        LOG.error("Accounts %s not created, run tools/clear_tempest.py to "
+                  "remove their remains" % ', '.join(map(str, failed)))
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
+
+# EOF